@@ -35,25 +35,21 @@ if index == 0:
     child.expect_exact("R1#")
 print("Connected to the device.")
 
+# Turn off paging for this session, so long output arrives in one piece instead of one
+# --More-- page at a time
+child.sendline("terminal length 0\r")
+child.expect_exact("R1#")
+
 # Get the device's hardware and software information
 child.sendline("show version\r")
 
-# Create a variable to hold the information
+# Read the output in one pass
 output = ""
-
-# Initialize the expect index
-index = -1
-
-# Use a loop to scroll through the output
-# You can also avoid the loop by sending the command, "terminal length 0"
-while index != 0:
-    index = child.expect(["R1#", "--More--", pexpect.TIMEOUT, ])
-    output = output + (child.before)
-    if index == 1:
-        child.sendline(" ")
-    elif index == 2:
-        print("Search string not found.")
-        break
+index = child.expect(["R1#", pexpect.TIMEOUT, ])
+if index == 0:
+    output = child.before
+else:
+    print("Search string not found.")
 print("Getting device information:\n" + output.strip().replace("\n\n", ""))
 
 # Cause and handle an error
@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for CiscoIOS operations and fleet scaling, using simulated devices.
+
+Developer notes:
+
+- The benchmarks start ios_simulator.py in its own process, so the simulated devices do not
+  compete with the benchmark for the interpreter, then run CiscoIOS operations against them.
+- Each operation is run a number of times on one device. For each operation, the results
+  show latency percentiles, the sends and expects per run, and where the time went:
+  sleeping (e.g., delaybeforesend and time.sleep), waiting for the device (inside expect()
+  and read calls), and everything else (e.g., parsing and bookkeeping).
+- The scaling run repeats a short workflow (connect, facts, configuration, save, close) on
+  1 to N devices at once, and shows the throughput at each size.
+- Connections use the telnet client (connect_via_telnet) if it is installed, and a plain
+  socket (connect_via_child) otherwise. fdspawn does not wait delaybeforesend before a send,
+  as pexpect.spawn does, so the socket transport waits itself; otherwise, the delay and
+  adaptive pacing would have no effect, and the socket results would show no sleep time.
+- The connect benchmark instruments the connection before the login, so its sends, expects,
+  and waits are counted like those of the other operations.
+- Results are saved as JSON, so results from different releases can be compared.
+- Unlike the other modules, this one can be run directly:
+
+    python benchmark.py --iterations 20 --scaling 1,10,50,100 --output results.json
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing.pool
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import pexpect
+from pexpect import fdpexpect
+
+from cisco_ios import CiscoIOS
+from reporter import Reporter, monotonic
+
+__all__ = ['OperationStats', 'BenchmarkSuite', 'percentile', 'main', ]
+
+ENABLE_PASSWORD = 'benchmark'
+EOL = '\r'
+
+# Per-thread instrumentation state: the stats being recorded, and the depth of nested waits
+_local = threading.local()
+_original_sleep = time.sleep
+
+
+def percentile(samples, percent):
+    """Get a percentile of a list of samples (nearest rank).
+
+    :param list samples: The samples.
+    :param float percent: The percentile (e.g., 90).
+    :return: The percentile, or None if there are no samples.
+    :rtype: float
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = int(round(percent / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[max(0, min(len(ordered) - 1, rank))]
+
+
+class OperationStats(object):
+    """Measurements of one benchmarked operation.
+    """
+
+    def __init__(self, name):
+        """Class instantiation.
+
+        :param str name: Name of the operation.
+        :return: None
+        :rtype: None
+        """
+        self.name = name
+        self.samples = []
+        self.failures = 0
+        self.sends = 0
+        self.expects = 0
+        self.reads = 0
+        self.sleep_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def summary(self):
+        """Get the operation's statistics. Counts and times are per run.
+
+        :rtype: dict
+        """
+        runs = len(self.samples) or 1
+        total = sum(self.samples)
+        return {'runs': len(self.samples),
+                'failures': self.failures,
+                'mean': total / runs,
+                'min': min(self.samples) if self.samples else None,
+                'max': max(self.samples) if self.samples else None,
+                'p50': percentile(self.samples, 50),
+                'p90': percentile(self.samples, 90),
+                'p99': percentile(self.samples, 99),
+                'sends': float(self.sends) / runs,
+                'expects': float(self.expects) / runs,
+                'reads': float(self.reads) / runs,
+                'sleep_seconds': self.sleep_seconds / runs,
+                'wait_seconds': self.wait_seconds / runs,
+                'other_seconds': (total - self.sleep_seconds - self.wait_seconds) / runs, }
+
+
+def _counting_sleep(seconds):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and not getattr(_local, 'depth', 0):
+        stats.sleep_seconds += seconds
+    _original_sleep(seconds)
+
+
+def _instrument(child):
+    """Count the sends, expects, and reads of a child, and time the waits, for the stats of
+    the current thread.
+
+    :param child: Connection in a child application object.
+    :return: None
+    :rtype: None
+    """
+    def counted_send(send):
+        def wrapper(*args, **kwargs):
+            stats = getattr(_local, 'stats', None)
+            if stats is not None:
+                stats.sends += 1
+            return send(*args, **kwargs)
+        return wrapper
+
+    def timed_wait(method, counter):
+        def wrapper(*args, **kwargs):
+            stats = getattr(_local, 'stats', None)
+            depth = getattr(_local, 'depth', 0)
+            if stats is None or depth:
+                # Reads inside an expect are part of the expect
+                return method(*args, **kwargs)
+            setattr(stats, counter, getattr(stats, counter) + 1)
+            _local.depth = 1
+            start = monotonic()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats.wait_seconds += monotonic() - start
+                _local.depth = 0
+        return wrapper
+
+    child.send = counted_send(child.send)
+    child.expect = timed_wait(child.expect, 'expects')
+    child.expect_exact = timed_wait(child.expect_exact, 'expects')
+    child.expect_loop = timed_wait(child.expect_loop, 'expects')
+    child.read_nonblocking = timed_wait(child.read_nonblocking, 'reads')
+
+
+class _InstrumentedSpawn(pexpect.spawn):
+    """pexpect.spawn that instruments itself when created, for connect methods that spawn
+    their own client (i.e., connect_via_telnet).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_InstrumentedSpawn, self).__init__(*args, **kwargs)
+        _instrument(self)
+
+
+class _PacedFdspawn(fdpexpect.fdspawn):
+    """fdspawn that waits delaybeforesend before each send, like pexpect.spawn.
+    """
+
+    def send(self, s):
+        if self.delaybeforesend:
+            time.sleep(self.delaybeforesend)
+        return super(_PacedFdspawn, self).send(s)
+
+
+class BenchmarkSuite(object):
+    def __init__(self, base_port=15001,
+                 latency=0.0,
+                 output_lines=2000,
+                 delay_before_send=None,
+                 adaptive_pacing=False,
+                 transport=None):
+        """Class instantiation.
+
+        :param int base_port: Port of the first simulated device.
+        :param float latency: Simulated device latency, in seconds.
+        :param int output_lines: Number of lines of long output (e.g., show tech-support).
+        :param float delay_before_send: Delay before each send, in seconds, or None to keep the
+            delay set by the connect method.
+        :param bool adaptive_pacing: True to use adaptive send pacing.
+        :param str transport: 'telnet' or 'socket', or None to use the telnet client if it is
+            installed.
+        :return: None
+        :rtype: None
+        """
+        self.base_port = base_port
+        self.latency = latency
+        self.output_lines = output_lines
+        self.delay_before_send = delay_before_send
+        self.adaptive_pacing = adaptive_pacing
+        if transport is None:
+            transport = 'telnet' if pexpect.which('telnet') else 'socket'
+        self.transport = transport
+        self.transcript_dir = tempfile.mkdtemp(prefix='benchmark-')
+        self.__simulator = None
+
+    def start_devices(self, count):
+        """Start the simulated devices, in their own process.
+
+        :param int count: Number of devices.
+        :return: None
+        :rtype: None
+        """
+        self.stop_devices()
+        simulator = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ios_simulator.py')
+        self.__simulator = subprocess.Popen(
+            [sys.executable, simulator, '--port', str(self.base_port), '--count', str(count),
+             '--enable-password', ENABLE_PASSWORD, '--latency', str(self.latency),
+             '--output-lines', str(self.output_lines)],
+            stdout=subprocess.PIPE)
+        # The simulator prints a line when all the devices are listening
+        self.__simulator.stdout.readline()
+
+    def stop_devices(self):
+        if self.__simulator is not None:
+            self.__simulator.terminate()
+            self.__simulator.wait()
+            self.__simulator = None
+
+    def connect(self, n, reporter, instrument=False):
+        """Connect to a simulated device.
+
+        :param int n: Index of the device (0 for the first device).
+        :param Reporter reporter: The device's reporter.
+        :param bool instrument: True to instrument the connection (see _instrument) before the
+            login. Only use from one thread at a time; with the telnet transport, pexpect.spawn
+            is replaced while connecting.
+        :return: The device's CiscoIOS instance and connection.
+        :rtype: tuple
+        """
+        device = CiscoIOS('R{0}'.format(n + 1), adaptive_pacing=self.adaptive_pacing,
+                          transcript_options={'directory': self.transcript_dir, })
+        if self.transport == 'telnet':
+            spawn = pexpect.spawn
+            if instrument:
+                pexpect.spawn = _InstrumentedSpawn
+            try:
+                child = device.connect_via_telnet(reporter, EOL, '127.0.0.1',
+                                                  self.base_port + n,
+                                                  enable_password=ENABLE_PASSWORD)
+            finally:
+                pexpect.spawn = spawn
+        else:
+            sock = socket.create_connection(('127.0.0.1', self.base_port + n))
+            # The child owns a copy of the socket's file descriptor, and closes it
+            child = _PacedFdspawn(os.dup(sock.fileno()), timeout=60)
+            sock.close()
+            if instrument:
+                _instrument(child)
+            device.connect_via_child(reporter, EOL, child, enable_password=ENABLE_PASSWORD)
+        if self.delay_before_send is not None:
+            child.delaybeforesend = self.delay_before_send
+        return device, child
+
+    def close(self, child, reporter):
+        if self.transport == 'telnet':
+            CiscoIOS.close_telnet_connection(child, reporter)
+        else:
+            child.close()
+
+    def operations(self):
+        """Get the benchmarked operations, in the order they run.
+
+        :return: (name, callable) tuples; each callable accepts the device, child, and reporter.
+        :rtype: list
+        """
+        config_lines = ['interface FastEthernet0/{0}\n description benchmark {0}\n'
+                        ' no shutdown'.format(n) for n in range(10)]
+        config_lines = '\n'.join(config_lines).split('\n')
+        return [
+            ('get_device_info', lambda d, c, r: d.get_device_info(
+                c, r, EOL, enable_password=ENABLE_PASSWORD)),
+            ('get_device_facts', lambda d, c, r: d.get_device_facts(
+                c, r, EOL, enable_password=ENABLE_PASSWORD)),
+            ('run_show', lambda d, c, r: d.run_show(
+                c, r, EOL, 'show tech-support', enable_password=ENABLE_PASSWORD)),
+            ('send_config_lines', lambda d, c, r: d.send_config_lines(
+                c, r, EOL, config_lines, enable_password=ENABLE_PASSWORD, commit=False)),
+            ('secure_device', lambda d, c, r: d.secure_device(
+                c, r, EOL, vty_username='admin', vty_password='admin',
+                enable_password=ENABLE_PASSWORD, commit=False)),
+            ('save_running_configuration', lambda d, c, r: d.save_running_configuration(
+                c, EOL, enable_password=ENABLE_PASSWORD)),
+            ('upload_to_device_scp', lambda d, c, r: d.upload_to_device_scp(
+                c, r, EOL, 'flash', '127.0.0.1', 'admin', '/tmp/benchmark.cfg',
+                'benchmark.cfg', 'admin', enable_password=ENABLE_PASSWORD)),
+            ('download_from_device_scp', lambda d, c, r: d.download_from_device_scp(
+                c, r, EOL, 'flash', '127.0.0.1', 'admin', 'benchmark.cfg',
+                '/tmp/benchmark.cfg', 'admin', enable_password=ENABLE_PASSWORD)),
+        ]
+
+    @staticmethod
+    def __measure(stats, function, *args):
+        """Run a function, and record its time and counters."""
+        _local.stats = stats
+        _local.depth = 0
+        start = monotonic()
+        try:
+            result = function(*args)
+            stats.samples.append(monotonic() - start)
+            return result
+        except Exception:
+            stats.failures += 1
+            raise
+        finally:
+            _local.stats = None
+
+    def run_operations(self, iterations=10, warmup=1):
+        """Run each operation on one device.
+
+        :param int iterations: Measured runs of each operation.
+        :param int warmup: Unmeasured runs of each operation before the measured runs.
+        :return: OperationStats by operation name.
+        :rtype: dict
+        """
+        results = {}
+        self.start_devices(1)
+        time.sleep = _counting_sleep
+        try:
+            connect_stats = OperationStats('connect')
+            for _ in range(iterations):
+                reporter = Reporter(stream=StringIO())
+                child = self.__measure(connect_stats,
+                                       lambda: self.connect(0, reporter, instrument=True))[1]
+                self.close(child, reporter)
+            results['connect'] = connect_stats
+
+            reporter = Reporter(stream=StringIO())
+            device, child = self.connect(0, reporter, instrument=True)
+            for name, operation in self.operations():
+                stats = OperationStats(name)
+                for _ in range(warmup):
+                    operation(device, child, reporter)
+                for _ in range(iterations):
+                    self.__measure(stats, operation, device, child, reporter)
+                results[name] = stats
+            self.close(child, reporter)
+        finally:
+            time.sleep = _original_sleep
+            self.stop_devices()
+        return results
+
+    def __workflow(self, n):
+        """Connect to a device, run a short workflow, and close the connection.
+
+        :return: The workflow's time, in seconds, or None if it failed.
+        """
+        reporter = Reporter(stream=StringIO())
+        start = monotonic()
+        try:
+            device, child = self.connect(n, reporter)
+            try:
+                device.get_device_facts(child, reporter, EOL)
+                device.send_config_lines(child, reporter, EOL,
+                                         ['interface FastEthernet0/0', ' no shutdown'])
+            finally:
+                self.close(child, reporter)
+        except Exception:
+            return None
+        return monotonic() - start
+
+    def run_scaling(self, device_counts, max_workers=None):
+        """Run the workflow on increasing numbers of devices at once.
+
+        :param list device_counts: Numbers of devices (e.g., [1, 10, 100]).
+        :param int max_workers: Most devices to work on at the same time, or None for all.
+        :return: The results for each number of devices.
+        :rtype: list
+        """
+        results = []
+        self.start_devices(max(device_counts))
+        try:
+            for count in device_counts:
+                pool = multiprocessing.pool.ThreadPool(min(count, max_workers or count))
+                start = monotonic()
+                try:
+                    times = pool.map(self.__workflow, range(count))
+                finally:
+                    pool.close()
+                    pool.join()
+                elapsed = monotonic() - start
+                done = [t for t in times if t is not None]
+                results.append({'devices': count,
+                                'elapsed': elapsed,
+                                'failures': count - len(done),
+                                'devices_per_minute': len(done) / elapsed * 60.0,
+                                'p50': percentile(done, 50),
+                                'p90': percentile(done, 90),
+                                'p99': percentile(done, 99), })
+        finally:
+            self.stop_devices()
+        return results
+
+
+def _print_results(operations, scaling, stream=None):
+    stream = stream if stream is not None else sys.stdout
+    if operations:
+        stream.write('{0:<28}{1:>9}{2:>9}{3:>9}{4:>8}{5:>9}{6:>9}{7:>9}{8:>9}\n'.format(
+            'Operation', 'p50 (s)', 'p90 (s)', 'p99 (s)', 'Sends', 'Expects', 'Sleep',
+            'Wait', 'Other'))
+        for name, summary in operations.items():
+            if not summary['runs']:
+                continue
+            stream.write(
+                '{0:<28}{1:>9.3f}{2:>9.3f}{3:>9.3f}{4:>8.1f}{5:>9.1f}{6:>9.3f}{7:>9.3f}'
+                '{8:>9.3f}\n'.format(name, summary['p50'], summary['p90'], summary['p99'],
+                                     summary['sends'], summary['expects'],
+                                     summary['sleep_seconds'], summary['wait_seconds'],
+                                     summary['other_seconds']))
+    if scaling:
+        stream.write('\n{0:>8}{1:>12}{2:>16}{3:>10}{4:>10}\n'.format(
+            'Devices', 'Elapsed (s)', 'Devices/minute', 'p90 (s)', 'Failures'))
+        for r in scaling:
+            stream.write('{0:>8}{1:>12.2f}{2:>16.1f}{3:>10}{4:>10}\n'.format(
+                r['devices'], r['elapsed'], r['devices_per_minute'],
+                '{0:.3f}'.format(r['p90']) if r['p90'] is not None else '-', r['failures']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark CiscoIOS against simulated devices.')
+    parser.add_argument('--iterations', type=int, default=10, help='measured runs per operation')
+    parser.add_argument('--warmup', type=int, default=1, help='unmeasured runs per operation')
+    parser.add_argument('--scaling', default='1,10,50',
+                        help='comma-separated device counts for the scaling run, or none')
+    parser.add_argument('--max-workers', type=int, help='most devices at once while scaling')
+    parser.add_argument('--port', type=int, default=15001, help='port of the first device')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated device latency, in seconds')
+    parser.add_argument('--output-lines', type=int, default=2000,
+                        help='lines of long output (e.g., show tech-support)')
+    parser.add_argument('--delay-before-send', type=float,
+                        help='delay before each send, in seconds (default: as connected)')
+    parser.add_argument('--adaptive-pacing', action='store_true', help='use adaptive pacing')
+    parser.add_argument('--transport', choices=('telnet', 'socket', ),
+                        help='connection type (default: telnet, if installed)')
+    parser.add_argument('--output', help='file to save the results to, as JSON')
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(base_port=args.port,
+                           latency=args.latency,
+                           output_lines=args.output_lines,
+                           delay_before_send=args.delay_before_send,
+                           adaptive_pacing=args.adaptive_pacing,
+                           transport=args.transport)
+    operations = {}
+    if args.iterations > 0:
+        operations = dict((name, stats.summary()) for name, stats in
+                          suite.run_operations(args.iterations, args.warmup).items())
+    scaling = []
+    if args.scaling and args.scaling != 'none':
+        scaling = suite.run_scaling([int(n) for n in args.scaling.split(',')], args.max_workers)
+    _print_results(operations, scaling)
+    if args.output:
+        results = {'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'python': platform.python_version(),
+                   'pexpect': pexpect.__version__,
+                   'platform': platform.platform(),
+                   'settings': vars(args),
+                   'transport': suite.transport,
+                   'operations': operations,
+                   'scaling': scaling, }
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Growable byte buffer for capturing large command output.
+
+Developer notes:
+
+- Appending strings (e.g., output = output + child.before) copies everything collected so far
+  on every read, so collecting large output (e.g., show tech-support) takes quadratic time.
+- CaptureBuffer appends each read into one bytearray, doubling its capacity when full, so
+  collecting output takes linear time, and the only extra memory is the unused capacity.
+- Read the result through memoryview slices (view() and iter_lines()), which do not copy the
+  data, or copy it once with getvalue() or decode().
+"""
+import sys
+
+__all__ = ['CaptureBuffer', ]
+
+
+class CaptureBuffer(object):
+    def __init__(self, size_hint=1024 * 1024):
+        """Class instantiation.
+
+        :param int size_hint: Initial capacity, in bytes. Set it to the expected size of the
+            output to avoid growing the buffer.
+        :return: None
+        :rtype: None
+        """
+        self.__data = bytearray(max(1, size_hint))
+        self.__length = 0
+
+    def write(self, data):
+        """Append data to the buffer.
+
+        :param data: Bytes, or text, which is stored as UTF-8.
+        :return: Number of bytes appended.
+        :rtype: int
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.encode('utf-8')
+        size = len(data)
+        end = self.__length + size
+        if end > len(self.__data):
+            # Double the capacity, so appends take amortized constant time per byte
+            self.__data.extend(bytearray(max(end, 2 * len(self.__data)) - len(self.__data)))
+        self.__data[self.__length:end] = data
+        self.__length = end
+        return size
+
+    def __len__(self):
+        return self.__length
+
+    @property
+    def capacity(self):
+        return len(self.__data)
+
+    def view(self, start=0, end=None):
+        """Get part of the data, without copying it.
+
+        **Note** - Release views (or let them go out of scope) before the next write; Python
+        cannot resize a buffer while a view of it exists.
+
+        :param int start: Offset of the first byte.
+        :param int end: Offset after the last byte, or None for the end of the data.
+        :return: The data.
+        :rtype: memoryview
+        """
+        end = self.__length if end is None else min(end, self.__length)
+        return memoryview(self.__data)[start:end]
+
+    def find(self, sub, start=0):
+        """Find the first occurrence of a byte string.
+
+        :param bytes sub: The byte string.
+        :param int start: Offset to start from.
+        :return: The offset, or -1 if not found.
+        :rtype: int
+        """
+        return self.__data.find(sub, start, self.__length)
+
+    def endswith(self, suffix, strip=b' '):
+        """Check if the data ends with a byte string, ignoring trailing characters.
+
+        :param bytes suffix: The byte string.
+        :param bytes strip: Trailing characters to ignore.
+        :return: True if the data ends with the suffix.
+        :rtype: bool
+        """
+        tail = self.view(max(0, self.__length - len(suffix) - 16)).tobytes()
+        return tail.rstrip(strip).endswith(suffix)
+
+    def iter_lines(self):
+        """Iterate over the lines of the data, without copying them. Line endings (LF, and any
+        CR before it) are removed.
+
+        :return: The lines.
+        :rtype: collections.Iterator[memoryview]
+        """
+        start = 0
+        while start < self.__length:
+            end = self.__data.find(b'\n', start, self.__length)
+            if end == -1:
+                end = self.__length
+            line_end = end
+            while line_end > start and self.__data[line_end - 1] == 13:
+                line_end -= 1
+            yield self.view(start, line_end)
+            start = end + 1
+
+    def truncate(self, size):
+        """Drop the data after the first size bytes. The capacity does not change.
+
+        :param int size: Number of bytes to keep.
+        :return: None
+        :rtype: None
+        """
+        self.__length = max(0, min(size, self.__length))
+
+    def clear(self):
+        self.__length = 0
+
+    def getvalue(self):
+        """Copy the data.
+
+        :rtype: bytes
+        """
+        return self.view().tobytes()
+
+    def decode(self, encoding='utf-8', errors='replace'):
+        """Copy the data as text.
+
+        :param str encoding: The encoding of the data.
+        :param str errors: How to handle bytes that cannot be decoded.
+        :rtype: str
+        """
+        return self.getvalue().decode(encoding, errors)
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
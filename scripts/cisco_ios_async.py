@@ -0,0 +1,900 @@
+# -*- coding: utf-8 -*-
+"""Common Cisco IOS and IOS-XE tasks, using asyncio.
+
+Developer notes:
+
+- Requires Python 3.5+; the rest of the scripts directory still runs on Python 2.7.
+- The methods mirror those in CiscoIOS, but are coroutines, so one event loop can hold
+  thousands of device sessions open without a thread per device.
+- Telnet sessions use a native asyncio connection (no telnet client process), so each
+  session only costs a socket and a small buffer. SSH and serial sessions still spawn a
+  client process, but are read without blocking the event loop.
+- Blocking host commands (e.g., starting the FTP service) run in the loop's default executor.
+- Like CiscoIOS, each session tracks its CLI mode, and operations only resynchronize with the
+  device (a five-second wait and a tracer round) when the mode is unknown.
+
+"""
+import asyncio
+import os
+import sys
+
+import pexpect
+
+from cisco_ios import CiscoIOS
+from device_facts import parse_device_facts
+from escape_filter import EscapeFilter
+from host_services import get_host_service_manager
+from utility import (validate_ip_address,
+                     validate_port_number,
+                     fix_tftp_filepath,
+                     validate_file_path,
+                     prep_for_tftp_download, )
+
+__all__ = ['AsyncCiscoIOS', 'AsyncTelnetSession', 'AsyncSpawnSession', 'run_concurrently', ]
+
+# Telnet protocol bytes (RFC 854)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+ECHO = 1
+SGA = 3
+
+
+class _AsyncSessionBase(object):
+    """Buffering and pattern matching shared by the async session types.
+
+    Like pexpect, expect_exact() sets before and after, and returns the index of the pattern
+    that matched. Include pexpect.TIMEOUT or pexpect.EOF in the pattern list to return their
+    index instead of raising the exception.
+    """
+    maxread = 4096
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.delaybeforesend = 0.05
+        self.buffer = ''
+        self.before = ''
+        self.after = ''
+        self.logfile = None
+        # Index of the device prompt the session stopped at (e.g., CiscoIOS.PRIV_EXEC_MODE), or
+        # None if unknown; set by AsyncCiscoIOS, and cleared by every send
+        self.cli_mode = None
+        # Removes terminal escape sequences from the text as it is read
+        self.escape_filter = EscapeFilter()
+
+    async def _read_some(self):
+        """Return the next chunk of text, or '' at EOF."""
+        raise NotImplementedError
+
+    def _write(self, text):
+        raise NotImplementedError
+
+    async def send(self, text):
+        # The CLI mode is unknown until the next prompt
+        self.cli_mode = None
+        if self.delaybeforesend:
+            await asyncio.sleep(self.delaybeforesend)
+        self._write(text)
+        return len(text)
+
+    async def sendline(self, text=''):
+        return await self.send(text + os.linesep)
+
+    async def sendcontrol(self, char):
+        return await self.send(chr(ord(char.lower()) - ord('a') + 1) if char.isalpha() else
+                               {']': '\x1d', '[': '\x1b', '\\': '\x1c', '^': '\x1e',
+                                '_': '\x1f', }[char])
+
+    def _search(self, patterns):
+        best = None
+        for i, p in enumerate(patterns):
+            if p in (pexpect.TIMEOUT, pexpect.EOF):
+                continue
+            start = self.buffer.find(p)
+            if start != -1 and (best is None or start < best[1]):
+                best = (i, start, start + len(p))
+        return best
+
+    async def expect_exact(self, pattern_list, timeout=-1):
+        if not isinstance(pattern_list, (list, tuple)):
+            pattern_list = [pattern_list, ]
+        if timeout == -1:
+            timeout = self.timeout
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            found = self._search(pattern_list)
+            if found is not None:
+                index, start, end = found
+                self.before = self.buffer[:start]
+                self.after = self.buffer[start:end]
+                self.buffer = self.buffer[end:]
+                return index
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError()
+                data = await asyncio.wait_for(self._read_some(), remaining)
+            except asyncio.TimeoutError:
+                return self._no_match(pattern_list, pexpect.TIMEOUT)
+            if not data:
+                return self._no_match(pattern_list, pexpect.EOF)
+            if self.logfile is not None:
+                self.logfile.write(data)
+            self.buffer += self.escape_filter.feed(data)
+
+    def _no_match(self, pattern_list, exc_type):
+        self.before = self.buffer
+        # Like pexpect, keep the buffer after a time-out, so output that was still arriving
+        # (e.g., part of a prompt) can match the next expect; nothing more arrives after EOF
+        if exc_type is pexpect.EOF:
+            self.buffer = ''
+        self.after = exc_type
+        if exc_type in pattern_list:
+            return list(pattern_list).index(exc_type)
+        raise exc_type('No match for {0!r}'.format(pattern_list))
+
+
+class AsyncTelnetSession(_AsyncSessionBase):
+    """Telnet session on a native asyncio connection.
+
+    Only the options that Cisco devices and terminal servers ask for (echo and suppress
+    go-ahead) are accepted; all other options are refused.
+    """
+
+    def __init__(self, reader, writer, timeout=30):
+        super(AsyncTelnetSession, self).__init__(timeout)
+        self._reader = reader
+        self._writer = writer
+        self._pending = b''
+
+    @classmethod
+    async def open(cls, host, port=23, timeout=30):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        return cls(reader, writer, timeout)
+
+    def _negotiate(self, data):
+        """Remove telnet commands from the data and answer any option requests."""
+        data = self._pending + data
+        self._pending = b''
+        out = bytearray()
+        i = 0
+        while i < len(data):
+            b = data[i]
+            if b != IAC:
+                out.append(b)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self._pending = data[i:]
+                break
+            cmd = data[i + 1]
+            if cmd == IAC:
+                out.append(IAC)
+                i += 2
+            elif cmd in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self._pending = data[i:]
+                    break
+                opt = data[i + 2]
+                if cmd == WILL:
+                    reply = DO if opt in (ECHO, SGA) else DONT
+                    self._writer.write(bytes([IAC, reply, opt]))
+                elif cmd == DO:
+                    reply = WILL if opt == SGA else WONT
+                    self._writer.write(bytes([IAC, reply, opt]))
+                i += 3
+            elif cmd == SB:
+                end = data.find(bytes([IAC, SE]), i)
+                if end == -1:
+                    self._pending = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        return bytes(out)
+
+    async def _read_some(self):
+        while True:
+            data = await self._reader.read(self.maxread)
+            if not data:
+                return ''
+            data = self._negotiate(data)
+            if data:
+                return data.decode('utf-8', 'replace')
+
+    def _write(self, text):
+        self._writer.write(text.encode('utf-8').replace(b'\xff', b'\xff\xff'))
+
+    async def close(self):
+        self._writer.close()
+
+
+class AsyncSpawnSession(_AsyncSessionBase):
+    """Client process (e.g., ssh or minicom) read through the event loop.
+    """
+
+    def __init__(self, command, timeout=30):
+        super(AsyncSpawnSession, self).__init__(timeout)
+        self.child = pexpect.spawn(command, timeout=timeout, encoding='utf-8',
+                                   codec_errors='replace')
+        # Never let pexpect sleep; it would block the whole event loop
+        self.child.delaybeforesend = None
+
+    async def _read_some(self):
+        # Wait for the pty to become readable without tying up a thread
+        loop = asyncio.get_event_loop()
+        readable = loop.create_future()
+        fd = self.child.child_fd
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        try:
+            return self.child.read_nonblocking(self.maxread, timeout=0)
+        except pexpect.EOF:
+            return ''
+
+    def _write(self, text):
+        self.child.send(text)
+
+    async def close(self):
+        self.child.close(force=True)
+
+
+async def run_concurrently(coroutines, max_concurrency=500):
+    """Run coroutines on the current event loop, no more than max_concurrency at a time.
+
+    :param list coroutines: Coroutine objects (e.g., one workflow per device).
+    :param int max_concurrency: Maximum number of coroutines in progress.
+    :return: The results (or raised exceptions), in the same order as the coroutines.
+    :rtype: list
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[bounded(c) for c in coroutines], return_exceptions=True)
+
+
+class AsyncCiscoIOS(object):
+    cisco_prompts = CiscoIOS.cisco_prompts
+    USER_EXEC_MODE = CiscoIOS.USER_EXEC_MODE
+    PRIV_EXEC_MODE = CiscoIOS.PRIV_EXEC_MODE
+    CONFIG_MODE = CiscoIOS.CONFIG_MODE
+
+    def __init__(self, device_hostname, host_services=None, track_cli_mode=True):
+        """Class instantiation.
+
+        **Note** - The CLI mode is tracked per session (session.cli_mode), so one instance can
+        serve several sessions to the same device.
+
+        :param str device_hostname: Hostname of the device.
+        :param host_services.HostServiceManager host_services: Manager that starts and stops the
+            host's TFTP and FTP services for transfers, or None to share the manager of the
+            process.
+        :param bool track_cli_mode: True to skip resynchronizing with the device when the
+            session's CLI mode is already known, or False to resynchronize (a five-second wait
+            and a tracer round) at the start of every operation.
+        :return: None
+        :rtype: None
+        """
+        self.device_hostname = device_hostname
+        self.track_cli_mode = track_cli_mode
+        self.host_services = (host_services if host_services is not None
+                              else get_host_service_manager())
+        # Prepend the hostname to the standard Cisco prompt endings
+        self.device_prompts = ['{0}{1}'.format(device_hostname, p) for p in self.cisco_prompts]
+
+    async def connect_via_telnet(self, reporter, eol,
+                                 telnet_ip_addr,
+                                 telnet_port_num=23,
+                                 username=None,
+                                 password=None,
+                                 enable_password=None,
+                                 verbose=False):
+        """Connect to a network device using Telnet. See CiscoIOS.connect_via_telnet.
+
+        :return: Connection in a session object.
+        :rtype: AsyncTelnetSession
+        """
+        reporter.step(
+            'Connecting to {0} on port {1} via Telnet...'.format(telnet_ip_addr, telnet_port_num))
+        validate_ip_address(telnet_ip_addr)
+        validate_port_number(telnet_port_num)
+        session = await AsyncTelnetSession.open(telnet_ip_addr, telnet_port_num)
+        if verbose:
+            session.logfile = sys.stdout
+        await self.__clear_startup_prompts(session, reporter, eol, username, password)
+        await self.__access_priv_exec_mode(session, eol, enable_password)
+        reporter.success()
+        return session
+
+    async def connect_via_ssh(self, reporter, eol,
+                              ssh_ip_addr,
+                              ssh_port_num=22,
+                              username=None,
+                              password=None,
+                              host_key_check=True,
+                              enable_password=None,
+                              verbose=False):
+        """Connect to a network device using SSH. See CiscoIOS.connect_via_ssh.
+
+        :return: Connection in a session object.
+        :rtype: AsyncSpawnSession
+        """
+        reporter.step(
+            'Connecting to {0} on port {1} via SSH...'.format(ssh_ip_addr, ssh_port_num))
+        ssh_options = ''
+        if host_key_check:
+            ssh_options = ' -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null'
+        validate_ip_address(ssh_ip_addr)
+        validate_port_number(ssh_port_num)
+        session = AsyncSpawnSession('ssh{0} -p {1} {2}@{3}'.format(
+            ssh_options, ssh_port_num, username, ssh_ip_addr))
+        index = await session.expect_exact(['Are you sure you want to continue connecting',
+                                             'Host key verification failed.',
+                                             pexpect.TIMEOUT, ])
+        if index == 0:
+            await session.sendline('yes')
+        elif index == 1:
+            raise RuntimeError('Host key verification failed. Check your known hosts file.')
+        if verbose:
+            session.logfile = sys.stdout
+        await self.__clear_startup_prompts(session, reporter, eol, username, password)
+        await self.__access_priv_exec_mode(session, eol, enable_password)
+        reporter.success()
+        return session
+
+    async def connect_via_serial(self, reporter, eol,
+                                 serial_device='/dev/ttyUSB0',
+                                 baud_rate=9600,
+                                 data_bits=8,
+                                 username=None,
+                                 password=None,
+                                 enable_password=None,
+                                 verbose=False):
+        """Connect to the device using Minicom. See CiscoIOS.connect_via_serial.
+
+        :return: Connection in a session object.
+        :rtype: AsyncSpawnSession
+        """
+        reporter.step('Connecting to device via {0}...'.format(serial_device))
+        if serial_device not in ('/dev/ttyACM0', '/dev/ttyUSB0',):
+            reporter.error()
+            raise ValueError('Invalid serial device name.')
+        if data_bits not in (7, 8,):
+            reporter.error()
+            raise ValueError('Invalid data bit size.')
+        mode = '--8bit' if data_bits == 8 else '--7bit'
+        session = AsyncSpawnSession('minicom --device {0} --baudrate {1} {2} --wrap'.format(
+            serial_device, baud_rate, mode))
+        if verbose:
+            session.logfile = sys.stdout
+        await self.__clear_startup_prompts(session, reporter, eol, username, password)
+        await self.__access_priv_exec_mode(session, eol, enable_password)
+        reporter.success()
+        return session
+
+    async def __clear_startup_prompts(self, session, reporter, eol,
+                                      username=None,
+                                      password=None):
+        """Clear startup messages and prompts until reaching a device prompt.
+        See CiscoIOS.__clear_startup_prompts.
+        """
+        index = await session.expect_exact(['Cisco', 'Loading', 'Waiting', 'Initializing',
+                                            pexpect.TIMEOUT, ] + self.device_prompts, timeout=60)
+        if index == 4:
+            await session.sendline('\r')
+        elif index > 4:
+            reporter.warn(
+                'You may be accessing an open or uncleared virtual teletype session.\n' +
+                'Output from previous commands may cause pexpect searches to fail.\n' +
+                'To prevent this in the future, reload the device to clear any artifacts.')
+            await session.sendline(eol)
+            await self.__reset_cursor(session, eol)
+            return
+
+        index = 0
+        while 0 <= index <= 6:
+            try:
+                index = await session.expect_exact(
+                    ['Login invalid',
+                     'Bad passwords',
+                     'Username:',
+                     'Password:',
+                     'Would you like to enter the initial configuration dialog',
+                     'Would you like to terminate autoinstall',
+                     'Press RETURN to get started',
+                     ] + self.device_prompts, timeout=300)
+                if index in (0, 1,):
+                    reporter.error()
+                    raise ValueError('Invalid credentials provided.')
+                elif index == 2:
+                    await session.sendline(username + eol)
+                elif index == 3:
+                    await session.sendline(password + eol)
+                elif index == 4:
+                    await session.sendline('no' + eol)
+                elif index == 5:
+                    await session.sendline('yes' + eol)
+                elif index == 6:
+                    await session.sendline('\r')
+            except pexpect.TIMEOUT:
+                reporter.error()
+                raise
+        session.cli_mode = index - 7
+
+    async def __access_priv_exec_mode(self, session, eol, enable_password=None):
+        """Place the cursor at a Privileged EXEC Mode prompt (e.g., switch#). Only
+        resynchronizes with the device if the session's CLI mode is unknown.
+        See CiscoIOS.__access_priv_exec_mode.
+        """
+        if session.cli_mode == self.PRIV_EXEC_MODE and self.track_cli_mode:
+            return
+        if session.cli_mode is None or not self.track_cli_mode:
+            await self.__reset_cursor(session, eol)
+        if session.cli_mode == self.USER_EXEC_MODE:
+            await session.sendline('enable' + eol)
+            index = await session.expect_exact(['Password:', self.device_prompts[1], ])
+            if index == 0:
+                await session.sendline(enable_password + eol)
+                await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+            else:
+                session.cli_mode = self.PRIV_EXEC_MODE
+        elif session.cli_mode != self.PRIV_EXEC_MODE:
+            await session.sendline('end' + eol)
+            await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+
+    async def __reset_cursor(self, session, eol):
+        """Send a 'tracer round' to move the cursor forward to the last hostname prompt.
+        See CiscoIOS.__reset_pexpect_cursor.
+        """
+        # Let any system messages clear without holding up the other sessions
+        await asyncio.sleep(5)
+        tracer_round = ';{0}'.format(id(session) ^ int(asyncio.get_event_loop().time() * 1000))
+        await session.sendline(tracer_round + eol)
+        await session.expect_exact(tracer_round)
+        session.cli_mode = await session.expect_exact(self.device_prompts)
+
+    async def __expect_prompt(self, session, mode, timeout=-1):
+        """Wait for the prompt of a CLI mode, and record the mode.
+        See CiscoIOS.__expect_prompt.
+        """
+        await session.expect_exact(self.device_prompts[mode], timeout=timeout)
+        session.cli_mode = mode
+
+    async def __send_config(self, session, eol, commands):
+        """Send (command, expected prompt index) pairs, waiting for each prompt.
+        """
+        for command, prompt_index in commands:
+            await session.sendline(command + eol)
+            await self.__expect_prompt(session, prompt_index)
+
+    async def save_running_configuration(self, session, eol, enable_password=None):
+        """Save any configuration changes. See CiscoIOS.save_running_configuration.
+        """
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        await session.sendline('copy running-config startup-config' + eol)
+        await session.expect_exact('Destination filename')
+        await session.sendline('startup-config' + eol)
+        await session.expect_exact('[OK]')
+        await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+
+    async def __show(self, session, eol, command, timeout=60):
+        """Run a command at a Privileged EXEC Mode prompt and return its output, answering any
+        --More-- prompts.
+        """
+        await session.sendline(command + eol)
+        output = []
+        while True:
+            index = await session.expect_exact([self.device_prompts[1], '--More--', ],
+                                               timeout=timeout)
+            output.append(session.before)
+            if index == 0:
+                session.cli_mode = self.PRIV_EXEC_MODE
+                return ''.join(output)
+            # A bare space shows the next page
+            await session.send(' ')
+
+    async def __collect_device_facts(self, session, eol, enable_password=None):
+        await self.__access_priv_exec_mode(session, eol, enable_password)
+        show_version = await self.__show(session, eol, 'show version')
+        show_inventory = await self.__show(session, eol, 'show inventory')
+        return parse_device_facts(show_version, show_inventory)
+
+    async def get_device_facts(self, session, reporter, eol, enable_password=None):
+        """Get facts about the network device. See CiscoIOS.get_device_facts.
+
+        :return: The device's facts.
+        :rtype: device_facts.DeviceFacts
+        """
+        reporter.step('Getting device facts...')
+        facts = await self.__collect_device_facts(session, eol, enable_password)
+        reporter.success()
+        return facts
+
+    async def get_device_info(self, session, reporter, eol, enable_password=None):
+        """Get information about the network device. See CiscoIOS.get_device_info.
+
+        :return: Name of the default file system; the device's IOS version; the device's name;
+            and the device's serial number.
+        :rtype: tuple
+        """
+        reporter.step('Getting device information...')
+        facts = await self.__collect_device_facts(session, eol, enable_password)
+        for value, what in ((facts.default_file_system, 'working drive'),
+                            (facts.software, 'software version'),
+                            (facts.description, 'name'),
+                            (facts.serial, 'serial number'),):
+            if value is None:
+                reporter.warn('Cannot get the device\'s {0}.'.format(what))
+        reporter.success()
+        return facts.default_file_system, facts.software, facts.description, facts.serial
+
+    async def secure_device(self, session, reporter, eol,
+                            vty_username=None,
+                            vty_password=None,
+                            privilege=15,
+                            console_password=None,
+                            aux_password=None,
+                            enable_password=None,
+                            commit=True):
+        """Secure the device. See CiscoIOS.secure_device.
+        """
+        reporter.step('Securing the network device...')
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        if not 1 <= privilege <= 15:
+            raise ValueError('Invalid CLI command access privilege: {0}'.format(privilege))
+
+        commands = [('configure terminal', 2), ]
+        if vty_username and vty_password:
+            commands += [('username {0} privilege {1} secret 0 {2}'.format(
+                vty_username, privilege, vty_password), 2),
+                ('line vty 0 4', 4), ('login local', 4), ('exit', 2), ]
+        for line, line_password in (('console 0', console_password), ('aux 0', aux_password),):
+            if line_password:
+                commands += [('line {0}'.format(line), 4),
+                             ('password 0 {0}'.format(line_password), 4),
+                             ('login', 4), ('exit', 2), ]
+        if console_password or aux_password:
+            commands.append(('service password-encryption', 2))
+        await self.__send_config(session, eol, commands)
+
+        if enable_password:
+            await self.__send_config(session, eol, [
+                ('enable secret {0}'.format(enable_password), 2), ('end', 1), ('disable', 0), ])
+            # Test security
+            await session.sendline('enable' + eol)
+            await session.expect_exact('Password:')
+            await session.sendline(enable_password + eol)
+            await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+        else:
+            await self.__send_config(session, eol, [('end', 1), ])
+
+        if commit:
+            await self.save_running_configuration(session, eol, enable_password=enable_password)
+        reporter.success()
+
+    async def enable_ssh(self, session, reporter, eol,
+                         label=None,
+                         modulus=1024,
+                         version=1.99,
+                         time_out=120,
+                         retries=3,
+                         enable_password=None,
+                         commit=True):
+        """Enable SSH communications. See CiscoIOS.enable_ssh.
+        """
+        reporter.step('Enabling SSH on the device...')
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        if not 350 <= modulus <= 4096:
+            raise ValueError('Invalid modulus size.')
+        if version not in (1, 1.99, 2,):
+            raise ValueError('Invalid SSH version.')
+        if not 1 <= time_out <= 2147483647:
+            raise ValueError('Invalid time-out wait time.')
+        if not 1 <= retries <= 5:
+            raise ValueError('Invalid authentication retries allowed.')
+
+        await self.__send_config(session, eol, [('configure terminal', 2), ])
+        await session.sendline('crypto key zeroize rsa' + eol)
+        index = await session.expect_exact(['Do you really want to remove these keys? [yes/no]:',
+                                            self.device_prompts[2], ])
+        if index == 0:
+            await self.__send_config(session, eol, [('yes', 2), ])
+        commands = [('crypto key generate rsa general-keys label {0} modulus {1}'.format(
+            label, modulus), 2), ]
+        if version == 1 or version == 2:
+            commands.append(('ip ssh version {0}'.format(version), 2))
+        else:
+            commands.append(('no ip ssh version', 2))
+        commands += [('ip ssh time-out {0}'.format(time_out), 2),
+                     ('ip ssh authentication-retries {0}'.format(retries), 2),
+                     ('end', 1), ]
+        await self.__send_config(session, eol, commands)
+
+        if commit:
+            await self.save_running_configuration(session, eol, enable_password=enable_password)
+        reporter.success()
+
+    async def __copy_dialog(self, session, eol, command, answers, error_message):
+        """Answer a copy command's prompts until the transfer completes.
+
+        :param str command: The copy command.
+        :param list answers: (prompt, reply) pairs; a reply of None means 'confirm'.
+        :param str error_message: Message for the RuntimeError raised if the device reports an
+            error.
+        """
+        await session.sendline(command + eol)
+        prompts = [a[0] for a in answers] + ['Error', 'bytes copied in', ]
+        index = 0
+        while index != len(prompts) - 1:
+            # Allow 10 minutes for the transfer
+            index = await session.expect_exact(prompts, timeout=600)
+            if index < len(answers):
+                await session.sendline((answers[index][1] or '') + eol)
+            elif index == len(answers):
+                raise RuntimeError(error_message)
+        await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+
+    async def download_from_device_scp(self, session, reporter, eol,
+                                       device_file_system,
+                                       remote_ip_addr,
+                                       remote_username,
+                                       file_to_download,
+                                       destination_filepath,
+                                       remote_password,
+                                       enable_password=None):
+        """Download a file from the device using SCP. See CiscoIOS.download_from_device_scp.
+        """
+        reporter.step('Downloading {0} from the device using SCP...'.format(file_to_download))
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        validate_ip_address(remote_ip_addr)
+        await self.__copy_dialog(
+            session, eol, 'copy {0}: scp:'.format(device_file_system),
+            [('Source filename', file_to_download),
+             ('Address or name of remote host', remote_ip_addr),
+             ('Destination username', remote_username),
+             ('Destination filename', destination_filepath.lstrip('/')),
+             ('Password:', remote_password),
+             ('Do you want to over', None), ],
+            'Unable to download file to container.')
+        reporter.success()
+
+    async def upload_to_device_scp(self, session, reporter, eol,
+                                   device_file_system,
+                                   remote_ip_addr,
+                                   remote_username,
+                                   file_to_upload,
+                                   destination_filepath,
+                                   remote_password,
+                                   enable_password=None):
+        """Upload a file from the remote host to the device using SCP.
+        See CiscoIOS.upload_to_device_scp.
+        """
+        reporter.step('Uploading {0} to the device using SCP...'.format(
+            os.path.basename(file_to_upload)))
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        validate_ip_address(remote_ip_addr)
+        await self.__copy_dialog(
+            session, eol, 'copy scp: {0}:'.format(device_file_system),
+            [('Address or name of remote host', remote_ip_addr),
+             ('Source username', remote_username),
+             ('Source filename', file_to_upload),
+             ('Destination filename', destination_filepath.lstrip('/')),
+             ('Password:', remote_password),
+             ('Do you want to over', None), ],
+            'Unable to upload file from container.')
+        reporter.success()
+
+    async def __set_ftp_credentials(self, session, eol, remote_username, remote_password):
+        await self.__send_config(session, eol, [
+            ('configure terminal', 2),
+            ('ip ftp username {0}'.format(remote_username), 2),
+            ('ip ftp password {0}'.format(remote_password), 2),
+            ('end', 1), ])
+
+    async def download_file_ftp(self, session, reporter, eol,
+                                device_file_system,
+                                remote_ip_addr,
+                                remote_username,
+                                file_to_download,
+                                destination_filepath,
+                                remote_password,
+                                enable_password=None):
+        """Download a file from a device using FTP. See CiscoIOS.download_file_ftp.
+        """
+        reporter.step('Downloading {0} from the device using FTP...'.format(file_to_download))
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        validate_ip_address(remote_ip_addr)
+        await self.__set_ftp_credentials(session, eol, remote_username, remote_password)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.host_services.acquire, 'ftp')
+        try:
+            await self.__copy_dialog(
+                session, eol, 'copy {0}: ftp:'.format(device_file_system),
+                [('Source filename', file_to_download),
+                 ('Address or name of remote host', remote_ip_addr),
+                 ('Destination username', remote_username),
+                 ('Destination filename', destination_filepath.lstrip('/')),
+                 ('Password:', remote_password),
+                 ('Do you want to over', None), ],
+                'Unable to download file to container.')
+        finally:
+            await loop.run_in_executor(None, self.host_services.release, 'ftp')
+        reporter.success()
+
+    async def upload_file_ftp(self, session, reporter, eol,
+                              device_file_system,
+                              remote_ip_addr,
+                              remote_username,
+                              file_to_upload,
+                              destination_filepath,
+                              remote_password,
+                              enable_password=None):
+        """Upload a file from the remote host to the device using FTP.
+        See CiscoIOS.upload_file_ftp.
+        """
+        reporter.step('Uploading {0} to the device using FTP...'.format(
+            os.path.basename(file_to_upload)))
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        validate_ip_address(remote_ip_addr)
+        await self.__set_ftp_credentials(session, eol, remote_username, remote_password)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.host_services.acquire, 'ftp')
+        try:
+            await self.__copy_dialog(
+                session, eol, 'copy ftp: {0}:'.format(device_file_system),
+                [('Address or name of remote host', remote_ip_addr),
+                 ('Source username', remote_username),
+                 ('Source filename', file_to_upload),
+                 ('Destination filename', destination_filepath.lstrip('/')),
+                 ('Password:', remote_password),
+                 ('Do you want to over', None), ],
+                'Unable to upload file from container.')
+        finally:
+            await loop.run_in_executor(None, self.host_services.release, 'ftp')
+        reporter.success()
+
+    async def download_from_device_tftp(self, session, reporter, eol,
+                                        device_file_system,
+                                        remote_ip_addr,
+                                        file_to_download,
+                                        destination_filepath,
+                                        enable_password=None,
+                                        tftp_server=None):
+        """Download a file from the device using TFTP.
+        See CiscoIOS.download_from_device_tftp.
+        """
+        reporter.step('Downloading {0} from the device using TFTP...'.format(file_to_download))
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        validate_ip_address(remote_ip_addr)
+        loop = asyncio.get_event_loop()
+        if tftp_server is not None:
+            destination_filepath = tftp_server.relative_path(destination_filepath)
+        else:
+            destination_filepath = fix_tftp_filepath(destination_filepath)
+            try:
+                validate_file_path('/var/lib/tftpboot/{0}'.format(destination_filepath))
+            except ValueError:
+                await loop.run_in_executor(None, prep_for_tftp_download,
+                                           '/var/lib/tftpboot/{0}'.format(destination_filepath))
+            await loop.run_in_executor(None, self.host_services.acquire, 'tftp')
+        try:
+            await session.sendline('copy {0}:/{1} tftp://{2}/{3}'.format(
+                device_file_system, file_to_download, remote_ip_addr,
+                destination_filepath) + eol)
+            await session.expect_exact('Address or name of remote host')
+            await session.sendline(remote_ip_addr + eol)
+            await session.expect_exact('Destination filename')
+            await session.sendline(destination_filepath + eol)
+            index = 0
+            while 0 <= index <= 2:
+                index = await session.expect_exact(
+                    ['Timed out', 'Error', 'Do you want to over', 'bytes copied in', ],
+                    timeout=600)
+                if index in (0, 1,):
+                    await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+                    raise RuntimeError('Cannot download file: Error {0}'.format(session.before))
+                if index == 2:
+                    await session.sendline('yes' + eol)
+            await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+        finally:
+            if tftp_server is None:
+                await loop.run_in_executor(None, self.host_services.release, 'tftp')
+        reporter.success()
+
+    async def upload_to_device_tftp(self, session, reporter, eol,
+                                    device_file_system,
+                                    remote_ip_addr,
+                                    file_to_upload,
+                                    destination_filepath,
+                                    enable_password=None,
+                                    tftp_server=None):
+        """Upload a file from the remote host to the device using TFTP.
+        See CiscoIOS.upload_to_device_tftp.
+        """
+        reporter.step('Uploading {0} to the device using TFTP:'.format(
+            os.path.basename(file_to_upload)))
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        validate_ip_address(remote_ip_addr)
+        loop = asyncio.get_event_loop()
+        if tftp_server is not None:
+            file_to_upload = tftp_server.relative_path(file_to_upload)
+            validate_file_path(os.path.join(tftp_server.root, file_to_upload))
+        else:
+            file_to_upload = fix_tftp_filepath(file_to_upload)
+            await loop.run_in_executor(None, self.host_services.acquire, 'tftp')
+        copied = False
+        try:
+            # Attempt TFTP copy three times in case of connection time-outs
+            for _ in range(3 + 1):
+                await session.sendline('copy tftp: {0}:'.format(device_file_system) + eol)
+                await session.expect_exact('Address or name of remote host')
+                await session.sendline(remote_ip_addr + eol)
+                await session.expect_exact('Source filename [')
+                await session.sendline(file_to_upload.lstrip('/') + eol)
+                await session.expect_exact('Destination filename [')
+                await session.sendline(destination_filepath.lstrip('/') + eol)
+                index = await session.expect_exact(
+                    ['Do you want to over', 'bytes copied in', 'Timed out', 'Error',
+                     pexpect.TIMEOUT, ], timeout=600)
+                if index == 0:
+                    await session.sendline(eol)
+                    index = await session.expect_exact(
+                        ['bytes copied in', 'Timed out', pexpect.TIMEOUT, ], timeout=600)
+                    if index == 0:
+                        copied = True
+                        break
+                elif index == 1:
+                    copied = True
+                    break
+        finally:
+            if tftp_server is None:
+                await loop.run_in_executor(None, self.host_services.release, 'tftp')
+        if not copied:
+            # Get a fresh prompt after the last failed attempt. After a successful attempt, the
+            # device prints the prompt on its own
+            await session.sendline(eol)
+            await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+            raise RuntimeError('Unable to upload file using TFTP.')
+        await self.__expect_prompt(session, self.PRIV_EXEC_MODE)
+        reporter.success()
+
+    async def reload_device(self, session, reporter, eol,
+                            username=None,
+                            password=None,
+                            enable_password=None):
+        """Reload and reboot the device. See CiscoIOS.reload_device.
+        """
+        reporter.step('Rebooting (~ 5 min):')
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        await session.sendline('reload' + eol)
+        await session.expect_exact('Proceed with reload? [confirm]')
+        await session.sendline(eol)
+        await self.__clear_startup_prompts(session, reporter, eol,
+                                           username=username, password=password)
+        await self.__access_priv_exec_mode(session, eol, enable_password=enable_password)
+        reporter.success()
+
+    @staticmethod
+    async def close(session, reporter):
+        """Close the session, whatever the transport.
+        """
+        reporter.step('Closing session...')
+        if session:
+            await session.close()
+        reporter.success()
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
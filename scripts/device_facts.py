@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Parse device facts from show version and show inventory.
+
+Developer notes:
+
+- Two commands give everything get_device_info used to collect with four: show version has
+  the software, image, uptime, memory, interfaces, serial number, and file systems; show
+  inventory has the product ID (PID), description, and chassis serial number.
+- The parsers only use regular expressions on whole lines, so they work on the output of any
+  IOS or IOS XE release. Facts that are missing from the output are None.
+- Terminal escape sequences are removed once, before parsing (sessions that filter escape
+  sequences as they are read have none left to remove).
+"""
+import re
+import sys
+from collections import namedtuple
+
+from escape_filter import strip_escapes
+
+__all__ = ['DeviceFacts', 'parse_device_facts', 'parse_show_version', 'parse_show_inventory', ]
+
+# Device file systems, in order of preference
+FILE_SYSTEM_NAMES = ('bootflash', 'flash', 'slot', 'disk',)
+
+_FIELDS = ['hostname',
+           'software',
+           'version',
+           'image',
+           'model',
+           'pid',
+           'serial',
+           'description',
+           'uptime',
+           'memory_kb',
+           'interfaces',
+           'file_systems',
+           'default_file_system',
+           'config_register', ]
+
+
+class DeviceFacts(namedtuple('DeviceFacts', _FIELDS)):
+    """Facts about a network device:
+
+    - hostname (str): Hostname in the uptime line.
+    - software (str): The software line (e.g., Cisco IOS Software, 3700 Software ...).
+    - version (str): Software version (e.g., 12.4(25d)).
+    - image (str): System image file (e.g., flash:c3745-adventerprisek9-mz.124-25d.bin).
+    - model (str): Model, from the processor line (e.g., 3745).
+    - pid (str): Product ID of the chassis, from show inventory.
+    - serial (str): Serial number of the chassis.
+    - description (str): Description of the chassis, from show inventory.
+    - uptime (str): Uptime (e.g., 1 hour, 5 minutes).
+    - memory_kb (int): Main and I/O memory, in kilobytes.
+    - interfaces (int): Number of physical interfaces.
+    - file_systems (dict): Size, in kilobytes, of each storage device, by description.
+    - default_file_system (str): Name of the working file system (e.g., flash).
+    - config_register (str): Configuration register (e.g., 0x2102).
+    """
+    __slots__ = ()
+
+
+def _search(pattern, text, group=1):
+    match = re.search(pattern, text, re.MULTILINE)
+    return match.group(group).strip() if match else None
+
+
+def parse_show_version(output):
+    """Parse the output of show version.
+
+    :param str output: The output of the command.
+    :return: The facts found, by DeviceFacts field name.
+    :rtype: dict
+    """
+    output = strip_escapes(output).replace('\r', '')
+    facts = dict.fromkeys(_FIELDS)
+    facts['software'] = _search(r'^(.*\b(?:IOS|ios)\b.*[Ss]oftware.*)$', output)
+    facts['version'] = _search(r'\bVersion ([^\s,]+)', output)
+    facts['image'] = _search(r'^System image file is "([^"]+)"', output)
+    facts['model'] = _search(r'^[Cc]isco (\S+) \(.*\) processor', output)
+    facts['serial'] = _search(
+        r'^(?:[Pp]rocessor [Bb]oard [IDid]{2}|System serial number\s*:)\s*(\S+)', output)
+    facts['pid'] = _search(r'^Model number\s*:\s*(\S+)', output)
+    facts['config_register'] = _search(r'^Configuration register is (\S+)', output)
+    match = re.search(r'^(\S+) uptime is (.+)$', output, re.MULTILINE)
+    if match:
+        facts['hostname'], facts['uptime'] = match.group(1), match.group(2).strip()
+    match = re.search(r'with (\d+)K(?:/(\d+)K)? bytes of memory', output)
+    if match:
+        facts['memory_kb'] = sum(int(m) for m in match.groups() if m)
+    # e.g., 2 FastEthernet interfaces, 1 Virtual Private Network (VPN) Module
+    counts = re.findall(r'^(\d+) [\w /()-]+? interfaces?\s*$', output, re.MULTILINE)
+    facts['interfaces'] = sum(int(c) for c in counts) if counts else None
+    # e.g., 125440K bytes of ATA System CompactFlash (Read/Write)
+    storage = re.findall(r'^(\d+)K bytes of (.+?)\.?\s*$', output, re.MULTILINE)
+    facts['file_systems'] = dict((d, int(k)) for k, d in storage)
+    facts['default_file_system'] = _default_file_system(facts['image'], facts['file_systems'])
+    return facts
+
+
+def _default_file_system(image, file_systems):
+    # The system image is usually on the working file system (e.g., flash:c3745-...)
+    if image and ':' in image:
+        name = image.split(':')[0]
+        if name.startswith(FILE_SYSTEM_NAMES):
+            return name
+    # Otherwise (e.g., the image was loaded over the network), look at the storage devices
+    for description in file_systems:
+        # IOS XE names the file system (e.g., 8113280K bytes of virtual hard disk at bootflash:)
+        name = _search(r'\bat (\w+):', description)
+        if name and name.startswith(FILE_SYSTEM_NAMES):
+            return name
+    descriptions = ' '.join(file_systems).lower()
+    for name in FILE_SYSTEM_NAMES:
+        if name in descriptions:
+            return name
+    return None
+
+
+def parse_show_inventory(output):
+    """Parse the chassis entry (the first entry) of the output of show inventory.
+
+    :param str output: The output of the command.
+    :return: The facts found, by DeviceFacts field name.
+    :rtype: dict
+    """
+    output = strip_escapes(output).replace('\r', '')
+    return {'description': _search(r'DESCR:\s*"([^"]*)"', output),
+            'pid': _search(r'PID:[ \t]*([^\s,]+)', output),
+            'serial': _search(r'SN:[ \t]*([^\s,]+)', output), }
+
+
+def parse_device_facts(show_version, show_inventory):
+    """Build the device's facts from the output of show version and show inventory.
+
+    :param str show_version: The output of show version.
+    :param str show_inventory: The output of show inventory.
+    :return: The device's facts.
+    :rtype: DeviceFacts
+    """
+    facts = parse_show_version(show_version)
+    for name, value in parse_show_inventory(show_inventory).items():
+        # Prefer the chassis entry of the inventory; fall back to show version
+        if value:
+            facts[name] = value
+    return DeviceFacts(**facts)
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
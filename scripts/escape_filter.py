@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Remove terminal escape sequences from session output as it arrives.
+
+Developer notes:
+
+- Devices, terminal servers, and Minicom send VT100/ANSI escape sequences (e.g., cursor
+  movement, colors, window titles) that break expect_exact() matches and output parsing.
+- An EscapeFilter removes Control Sequence Introducer (CSI), Operating System Command (OSC),
+  and other string (DCS, SOS, PM, and APC) and single escape sequences from each chunk once, as
+  it is read, keeping the state of any sequence split between two reads.
+- Each chunk is filtered in one pass of a precompiled regular expression, and chunks without
+  an ESC character are returned as they are, so clean output costs one str.find().
+- install_escape_filter() wraps a pexpect child's read_nonblocking(), so expect(), before,
+  after, and any reader built on read_nonblocking() see clean text. The transcript
+  (child.logfile) still receives the raw output.
+"""
+import re
+import sys
+
+__all__ = ['EscapeFilter', 'install_escape_filter', 'strip_escapes', ]
+
+_ESC = '\x1b'
+
+# Complete escape sequences, starting at an ESC
+_SEQUENCE = (r'\x1b(?:'
+             # CSI: parameters, intermediates, and a final character (e.g., ESC[2J, ESC[?25h)
+             r'\[[0-?]*[ -/]*[@-~]'
+             # OSC: ends with BEL or String Terminator (ESC\) (e.g., ESC]0;title BEL)
+             r'|\].*?(?:\x07|\x1b\\)'
+             # DCS, SOS, PM, and APC: end with String Terminator
+             r'|[PX^_].*?\x1b\\'
+             # Other sequences: intermediates and a final character (e.g., ESC(B), or a single
+             # character that does not start one of the sequences above (e.g., ESC7, ESC=)
+             r'|[ -/]+[0-~]|[0-OQ-WYZ\\`a-~])')
+
+# Escape sequences that are not complete yet, at the end of the data. A string sequence that
+# runs past a line break is assumed to be a stray ESC, so the text after it is not held back
+_PARTIAL_SEQUENCE = r'\x1b(?:\[[0-?]*[ -/]*|[\]PX^_][^\r\n]*|[ -/]*)\Z'
+
+# Longest incomplete sequence to hold back before deciding it is not a sequence
+MAX_SEQUENCE_LENGTH = 4096
+
+
+def _coerce(text, string_type):
+    """Convert ASCII text to the string type of the output (e.g., str to bytes).
+    """
+    if string_type is bytes and bytes is not str:
+        return text.encode('ascii')
+    return string_type(text)
+
+
+class EscapeFilter(object):
+    """Incremental escape sequence filter. Feed it chunks of text or bytes, in order, and it
+    returns them without escape sequences.
+    """
+
+    # Compiled expressions, by string type (e.g., bytes, str)
+    __expressions = {}
+
+    def __init__(self):
+        """Class instantiation.
+
+        :return: None
+        :rtype: None
+        """
+        # Start of an escape sequence that continues in the next chunk
+        self.__pending = None
+        # Number of escape sequences removed
+        self.removed = 0
+
+    @classmethod
+    def __compile(cls, string_type):
+        expressions = cls.__expressions.get(string_type)
+        if expressions is None:
+            expressions = (re.compile(_coerce(_SEQUENCE, string_type), re.DOTALL),
+                           re.compile(_coerce(_PARTIAL_SEQUENCE, string_type), re.DOTALL),
+                           _coerce(_ESC, string_type))
+            cls.__expressions[string_type] = expressions
+        return expressions
+
+    def feed(self, data):
+        """Filter the next chunk of output.
+
+        :param data: The chunk (str or bytes, the same type for every chunk).
+        :return: The chunk, without escape sequences. May be empty (e.g., if the chunk only held
+            an escape sequence), or include text held back from the previous chunk.
+        :rtype: str
+        """
+        if self.__pending:
+            data = self.__pending + data
+            self.__pending = None
+        sequence, partial, esc = self.__compile(type(data))
+        if esc not in data:
+            return data
+        data, removed = sequence.subn(data[:0], data)
+        self.removed += removed
+        # Hold back an incomplete sequence at the end, for the next chunk
+        match = partial.search(data, max(0, len(data) - MAX_SEQUENCE_LENGTH))
+        if match is not None:
+            self.__pending = data[match.start():]
+            data = data[:match.start()]
+        # Drop any ESC that does not start a sequence, and keep the text after it
+        return data.replace(esc, data[:0])
+
+    def flush(self):
+        """Get any text held back as the start of an incomplete escape sequence (e.g., when the
+        session ends).
+
+        :return: The text held back, or None.
+        :rtype: str
+        """
+        pending, self.__pending = self.__pending, None
+        return pending
+
+
+def strip_escapes(text):
+    """Remove escape sequences from a complete text.
+
+    :param str text: The text.
+    :return: The text, without escape sequences.
+    :rtype: str
+    """
+    escape_filter = EscapeFilter()
+    return escape_filter.feed(text) + (escape_filter.flush() or text[:0])
+
+
+def install_escape_filter(child):
+    """Filter escape sequences from everything a pexpect child reads from now on.
+
+    :param pexpect.spawn child: Connection in a child application object.
+    :return: The filter, for its counters.
+    :rtype: EscapeFilter
+    """
+    escape_filter = EscapeFilter()
+    read_nonblocking = child.read_nonblocking
+
+    def filtered_read_nonblocking(size=1, timeout=-1):
+        return escape_filter.feed(read_nonblocking(size, timeout))
+
+    child.read_nonblocking = filtered_read_nonblocking
+    return escape_filter
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
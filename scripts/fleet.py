@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""Run CiscoIOS workflows across many devices concurrently.
+
+Developer notes:
+
+- Each device gets its own CiscoIOS instance, pexpect child, and Reporter, so a failure or a
+  slow response on one device never affects the others.
+- Workers pull devices from the inventory as they finish (imap_unordered), so one slow device
+  only ties up its own worker.
+- Use threads (the default) for pexpect-bound work; use processes if the workflow does
+  enough parsing to contend for the GIL. In process mode, operations and inventory entries
+  must be picklable (i.e., no lambdas).
+
+Example inventory entry:
+
+    {'hostname': 'R1',
+     'transport': 'telnet',
+     'eol': '\\r',
+     'connect_args': {'telnet_ip_addr': '192.168.1.1', 'telnet_port_num': 5001, }, }
+
+Example operations (method name and keyword arguments, or a callable that accepts the device,
+child, reporter, and eol):
+
+    [('set_device_hostname', {'device_hostname': 'R1', }),
+     ('enable_ssh', {'label': 'R1', 'modulus': 2048, }), ]
+"""
+import multiprocessing.pool
+import sys
+import time
+import traceback
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from cisco_ios import CiscoIOS, TRANSPORTS
+from host_services import get_host_service_manager
+from reporter import Reporter, StepHistogram
+from transfers import TransferMetrics
+
+__all__ = ['FleetRunner', 'DeviceResult', 'run_device_workflow', ]
+
+
+class DeviceResult(object):
+    """The outcome of running a workflow on a single device.
+    """
+
+    def __init__(self, hostname):
+        """Class instantiation.
+
+        :param str hostname: Hostname of the device.
+        :return: None
+        :rtype: None
+        """
+        self.hostname = hostname
+        self.ok = False
+        self.error = None
+        self.traceback = None
+        self.failed_operation = None
+        self.return_values = []
+        self.output = ''
+        self.elapsed = 0.0
+        # Step durations for the device: reporter.StepHistogram by step name
+        self.step_histograms = {}
+        # Results of the device's file transfers (transfers.TransferResult), in order
+        self.transfers = []
+
+    def __repr__(self):
+        return '<DeviceResult {0} {1} in {2:.1f}s>'.format(
+            self.hostname, 'OK' if self.ok else 'FAILED', self.elapsed)
+
+
+def _operation_name(operation):
+    if callable(operation):
+        return getattr(operation, '__name__', repr(operation))
+    return operation[0]
+
+
+def _run_operation(device, child, reporter, eol, operation):
+    """Run a single operation against a connected device.
+
+    :param CiscoIOS device: The device's CiscoIOS instance.
+    :param pexpect.spawn child: Connection in a child application object.
+    :param Reporter reporter: The device's reporter.
+    :param str eol: EOL sequence (LF or CRLF) used by the connection.
+    :param operation: A (method name, keyword arguments) tuple, or a callable.
+    :return: The return value of the operation.
+    :raise ValueError: If the operation is not a public CiscoIOS method.
+    """
+    if callable(operation):
+        return operation(device, child, reporter, eol)
+    method_name, kwargs = operation
+    if method_name.startswith('_') or not hasattr(device, method_name):
+        raise ValueError('Invalid CiscoIOS operation: {0}'.format(method_name))
+    method = getattr(device, method_name)
+    if method_name in ('save_running_configuration', 'set_ftp_credentials',):
+        # These methods do not report their status
+        return method(child, eol, **(kwargs or {}))
+    return method(child, reporter, eol, **(kwargs or {}))
+
+
+def run_device_workflow(device_entry, operations, device_timeout=None, session_pool=None,
+                        progress=None):
+    """Connect to one device, run the operations in order, and disconnect.
+
+    This function never raises; errors are recorded in the result instead. It is a module-level
+    function so it can be pickled for process pools.
+
+    :param dict device_entry: The device's inventory entry.
+    :param list operations: The operations to run, in order.
+    :param int device_timeout: Default pexpect timeout, in seconds, for this device's child.
+    :param session_pool.SessionPool session_pool: Optional pool to borrow the connection from
+        and return it to, instead of connecting and disconnecting.
+    :param reporter.FleetReporter progress: Optional fleet reporter that shows the device's
+        progress.
+    :return: The outcome of the workflow.
+    :rtype: DeviceResult
+    """
+    hostname = device_entry['hostname']
+    result = DeviceResult(hostname)
+    stream = StringIO()
+    if progress is not None:
+        reporter = progress.device_reporter(hostname, stream=stream)
+    else:
+        reporter = Reporter(stream=stream, device=hostname)
+    start_time = time.time()
+    device = None
+    child = None
+    # Pooled devices keep the transfers of earlier runs
+    first_transfer = 0
+    transport = device_entry.get('transport', 'telnet')
+    try:
+        if transport not in TRANSPORTS:
+            raise ValueError('Invalid transport: {0}'.format(transport))
+        connect_method, close_method = TRANSPORTS[transport]
+        eol = device_entry.get('eol', '')
+        connect_args = dict(device_entry.get('connect_args', {}))
+        # Interleaved screen output from concurrent sessions is unreadable
+        connect_args.setdefault('verbose', False)
+
+        if session_pool is not None:
+            device, child = session_pool.acquire(
+                reporter, eol, hostname, transport, connect_args)
+            first_transfer = len(device.transfers)
+        else:
+            device = CiscoIOS(hostname)
+            child = getattr(device, connect_method)(reporter, eol, **connect_args)
+        if device_timeout:
+            child.timeout = device_timeout
+        for operation in operations:
+            result.failed_operation = _operation_name(operation)
+            result.return_values.append(
+                _run_operation(device, child, reporter, eol, operation))
+        result.failed_operation = None
+        result.ok = True
+    except Exception as ex:
+        result.error = '{0}: {1}'.format(type(ex).__name__, ex)
+        result.traceback = traceback.format_exc()
+        if reporter.awaiting_result:
+            reporter.error(result.error)
+    finally:
+        if child is not None and session_pool is not None:
+            # Do not hand a session left in an unknown state to the next job
+            session_pool.release(child, discard=not result.ok)
+        elif child is not None:
+            try:
+                getattr(CiscoIOS, close_method)(child, reporter)
+            except Exception:
+                # The connection may already be dead; make sure the child process is gone
+                child.close(force=True)
+        result.elapsed = time.time() - start_time
+        result.output = stream.getvalue()
+        result.step_histograms = reporter.histograms
+        if device is not None:
+            result.transfers = device.transfers[first_transfer:]
+        if progress is not None:
+            progress.finish_device(hostname, ok=result.ok)
+    return result
+
+
+def _run_device_workflow_star(args):
+    # Pool.imap_unordered only passes one argument
+    return run_device_workflow(*args)
+
+
+class FleetRunner(object):
+    def __init__(self, max_workers=16, use_processes=False, device_timeout=None,
+                 session_pool=None, progress=None, host_services=None):
+        """Class instantiation.
+
+        :param int max_workers: Maximum number of devices to work on at the same time.
+        :param bool use_processes: True to use a process pool instead of a thread pool.
+        :param int device_timeout: Default pexpect timeout, in seconds, for each device's child.
+        :param session_pool.SessionPool session_pool: Optional pool of authenticated sessions,
+            so consecutive runs against the same devices only connect once. Only available
+            with threads.
+        :param reporter.FleetReporter progress: Optional fleet reporter that shows a live
+            progress line while the devices run. Only available with threads.
+        :param list host_services: Names of host services (e.g., ['tftp', ]) to keep running for
+            the whole run, so transfers to each device do not start and stop them again. With
+            processes, only available if the workers are forked (e.g., on Linux), since the
+            workers inherit the leases when they start.
+        :return: None
+        :rtype: None
+        :raise ValueError: If an argument is invalid.
+        """
+        if max_workers < 1:
+            raise ValueError('Invalid number of workers.')
+        if use_processes and session_pool is not None:
+            raise ValueError('Sessions cannot be pooled across processes.')
+        if use_processes and progress is not None:
+            raise ValueError('Progress cannot be shown across processes.')
+        if (use_processes and host_services and
+                getattr(multiprocessing, 'get_start_method', lambda: 'fork')() != 'fork'):
+            # Workers that are not forked would start with no leases, and stop the services
+            # when their own transfers finish
+            raise ValueError('Host services can only be shared with forked worker processes.')
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.device_timeout = device_timeout
+        self.session_pool = session_pool
+        self.progress = progress
+        self.host_services = list(host_services or [])
+        self.results = []
+        self.elapsed = 0.0
+
+    def run(self, inventory, operations, on_result=None):
+        """Run the operations on every device in the inventory.
+
+        :param list inventory: Inventory entries (dicts), one per device.
+        :param list operations: The operations to run on each device, in order.
+        :param on_result: Optional callable that receives each DeviceResult as soon as the
+            device finishes.
+        :return: The results, in order of completion.
+        :rtype: list
+        :raise ValueError: If the inventory contains duplicate hostnames.
+        """
+        hostnames = [d['hostname'] for d in inventory]
+        if len(set(hostnames)) != len(hostnames):
+            raise ValueError('Inventory contains duplicate hostnames.')
+
+        self.results = []
+        if not inventory:
+            self.elapsed = 0.0
+            return self.results
+        workers = min(self.max_workers, len(inventory))
+        start_time = time.time()
+        if self.progress is not None:
+            self.progress.start(total=len(inventory))
+        manager = get_host_service_manager()
+        leased = []
+        pool = None
+        try:
+            # Take the leases before starting the pool, so forked worker processes inherit them,
+            # and a worker's transfer does not stop a service that other workers still use
+            for service in self.host_services:
+                manager.acquire(service)
+                leased.append(service)
+            if self.use_processes:
+                pool = multiprocessing.Pool(workers)
+            else:
+                pool = multiprocessing.pool.ThreadPool(workers)
+            jobs = [(d, operations, self.device_timeout, self.session_pool, self.progress)
+                    for d in inventory]
+            for result in pool.imap_unordered(_run_device_workflow_star, jobs):
+                self.results.append(result)
+                if on_result is not None:
+                    on_result(result)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for service in reversed(leased):
+                manager.release(service)
+            self.elapsed = time.time() - start_time
+            if self.progress is not None:
+                self.progress.stop()
+        return self.results
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def throughput(self):
+        """Completed devices per minute for the last run.
+
+        :rtype: float
+        """
+        if not self.elapsed:
+            return 0.0
+        return len(self.results) / self.elapsed * 60.0
+
+    def step_timings(self):
+        """Get the statistics of each kind of step (e.g., run_show), across all the devices in
+        the last run.
+
+        :return: StepHistogram.summary() by step name.
+        :rtype: dict
+        """
+        histograms = {}
+        for r in self.results:
+            for name, histogram in r.step_histograms.items():
+                histograms.setdefault(name, StepHistogram()).merge(histogram)
+        return dict((name, h.summary()) for name, h in histograms.items())
+
+    def transfer_throughput(self):
+        """Get the throughput of each transfer protocol (e.g., scp), across all the devices in
+        the last run.
+
+        :return: TransferMetrics.summary() of the transfers of the last run.
+        :rtype: dict
+        """
+        metrics = TransferMetrics()
+        for r in self.results:
+            for transfer in r.transfers:
+                metrics(transfer)
+        return metrics.summary()
+
+    def print_summary(self, stream=None):
+        """Print the outcome of the last run.
+
+        :param stream: File-like object that receives the summary (defaults to sys.stdout).
+        :return: None
+        :rtype: None
+        """
+        stream = stream if stream is not None else sys.stdout
+        stream.write('{0} devices in {1:.1f} seconds ({2:.1f} devices/minute): '
+                     '{3} succeeded, {4} failed\n'.format(len(self.results), self.elapsed,
+                                                         self.throughput, len(self.succeeded),
+                                                         len(self.failed)))
+        for r in self.failed:
+            stream.write('- {0}: {1} during {2}\n'.format(
+                r.hostname, r.error, r.failed_operation or 'connection'))
+        for protocol, stats in sorted(self.transfer_throughput().items()):
+            stream.write('{0}: {1} transfers, {2} bytes in {3:.1f} seconds ({4} bytes/sec), '
+                         '{5} retries, {6} skipped\n'.format(protocol.upper(), stats['transfers'],
+                                                            stats['bytes'], stats['seconds'],
+                                                            int(stats['throughput'] or 0),
+                                                            stats['retries'], stats['skipped']))
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Share the host's TFTP, FTP, SSH, and NTP services between transfers.
+
+Developer notes:
+
+- Starting or stopping a service takes several sudo systemctl and firewall-cmd commands. A
+  HostServiceManager starts a service for the first lease, keeps it running while any lease is
+  held, and stops it when the last lease is released, so transfers to many devices, one after
+  the other or in parallel threads, start and stop the service once, not once per transfer.
+- To keep a service running between transfers (e.g., a fleet pushing a file to each device,
+  one device at a time), hold a lease around the whole run:
+
+    with get_host_service_manager().lease('tftp'):
+        runner.run(devices, workflow)
+
+- Leases are counted per process. A worker process forked while a lease is held inherits the
+  lease, so its own transfers never stop the service; leases taken after the worker starts are
+  not seen by it. FleetRunner(use_processes=True, host_services=[...]) takes its leases before
+  it starts its workers, as does a lease held around runner.run().
+- timings() shows how many times each service was started and stopped, and how long it took.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from utility import (enable_tftp,
+                     disable_tftp,
+                     enable_ftp,
+                     disable_ftp,
+                     enable_ssh,
+                     disable_ssh,
+                     enable_ntp,
+                     disable_ntp, )
+
+__all__ = ['HostServiceManager', 'get_host_service_manager', 'SERVICES', ]
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+# Functions that start and stop each service
+SERVICES = {
+    'tftp': (enable_tftp, disable_tftp),
+    'ftp': (enable_ftp, disable_ftp),
+    'ssh': (enable_ssh, disable_ssh),
+    'ntp': (enable_ntp, disable_ntp),
+}
+
+
+class _ServiceState(object):
+    """Leases and counters of one service."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.leases = 0
+        self.total_leases = 0
+        self.setups = 0
+        self.teardowns = 0
+        self.setup_seconds = 0.0
+        self.teardown_seconds = 0.0
+
+
+class HostServiceManager(object):
+    def __init__(self, sudo_password=None, services=None):
+        """Class instantiation.
+
+        :param str sudo_password: The superuser password to execute commands that require
+            elevated privileges.
+        :param dict services: (start, stop) functions by service name, or None for SERVICES.
+            Each function accepts the sudo password.
+        :return: None
+        :rtype: None
+        """
+        self.sudo_password = sudo_password
+        self.services = services if services is not None else SERVICES
+        self.__states = dict((name, _ServiceState()) for name in self.services)
+
+    def __state(self, service):
+        try:
+            return self.__states[service]
+        except KeyError:
+            raise ValueError('Unknown host service: {0}.'.format(service))
+
+    def acquire(self, service):
+        """Take a lease on a service, starting it if no other lease is held.
+
+        :param str service: Name of the service (e.g., 'tftp').
+        :return: None
+        :rtype: None
+        :raise ValueError: If the service is unknown.
+        :raise RuntimeError: If unable to start the service.
+        """
+        state = self.__state(service)
+        with state.lock:
+            if state.leases == 0:
+                start = monotonic()
+                try:
+                    self.services[service][0](self.sudo_password)
+                finally:
+                    state.setup_seconds += monotonic() - start
+                state.setups += 1
+            state.leases += 1
+            state.total_leases += 1
+
+    def release(self, service):
+        """Release a lease on a service, stopping it if no other lease is held.
+
+        :param str service: Name of the service (e.g., 'tftp').
+        :return: None
+        :rtype: None
+        :raise ValueError: If the service is unknown, or no lease is held.
+        :raise RuntimeError: If unable to stop the service.
+        """
+        state = self.__state(service)
+        with state.lock:
+            if state.leases == 0:
+                raise ValueError('No lease is held on {0}.'.format(service))
+            state.leases -= 1
+            if state.leases == 0:
+                start = monotonic()
+                try:
+                    self.services[service][1](self.sudo_password)
+                finally:
+                    state.teardown_seconds += monotonic() - start
+                state.teardowns += 1
+
+    @contextmanager
+    def lease(self, service):
+        """Hold a lease on a service for the duration of a with block.
+
+        :param str service: Name of the service (e.g., 'tftp').
+        :return: None
+        :rtype: None
+        :raise ValueError: If the service is unknown.
+        :raise RuntimeError: If unable to start or stop the service.
+        """
+        self.acquire(service)
+        try:
+            yield
+        finally:
+            self.release(service)
+
+    def leases(self, service):
+        """Get the number of leases held on a service.
+
+        :param str service: Name of the service (e.g., 'tftp').
+        :rtype: int
+        """
+        return self.__state(service).leases
+
+    def timings(self):
+        """Get the number of leases, starts, and stops of each service used, and the time spent
+        starting and stopping it.
+
+        :return: Counters and times, in seconds, by service name.
+        :rtype: dict
+        """
+        timings = {}
+        for name, state in self.__states.items():
+            with state.lock:
+                if not state.total_leases:
+                    continue
+                timings[name] = {'leases': state.total_leases,
+                                 'held': state.leases,
+                                 'setups': state.setups,
+                                 'teardowns': state.teardowns,
+                                 'setup_seconds': state.setup_seconds,
+                                 'teardown_seconds': state.teardown_seconds, }
+        return timings
+
+
+# Manager shared by every CiscoIOS instance of this process that does not have its own
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_host_service_manager():
+    """Get the host service manager shared by this process.
+
+    :rtype: HostServiceManager
+    """
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = HostServiceManager()
+        return _default_manager
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
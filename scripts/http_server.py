@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""In-process HTTP file server for device transfers (copy http://...).
+
+Developer notes:
+
+- Serves the files in one directory to devices, with no vsftpd, TFTP service, or firewall
+  changes. Devices pull files with copy http://<host>:<port>/<file> <file system>: (see
+  CiscoIOS.upload_to_device_http).
+- Each client gets a thread of its own, so one image can be served to many devices at once.
+- File bodies are sent with socket.sendfile() (os.sendfile() on Linux), so the kernel copies
+  the file to the socket without passing it through Python. Python 2.7 falls back to reading
+  and writing in blocks.
+- Supports HEAD, single byte ranges (Range: bytes=...), so interrupted transfers can resume,
+  and persistent (HTTP/1.1 keep-alive) connections.
+- Read-only: the server never writes or lists files, and refuses paths outside its root.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote, unquote
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import quote, unquote
+
+__all__ = ['HttpFileServer', ]
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+# Block size when sendfile() is not available
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def _parse_range(header, size):
+    """Get the first and last byte of a single byte range.
+
+    :param str header: The Range header (e.g., 'bytes=0-1023', 'bytes=1024-', or 'bytes=-512').
+    :param int size: Size of the file.
+    :return: (first, last) byte positions, None if the header is not a single byte range (i.e.,
+        send the whole file), or False if the range is not satisfiable.
+    :rtype: tuple
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, _, last = ranges.strip().partition('-')
+    try:
+        if not first:
+            # The last bytes of the file
+            length = int(last)
+            if length <= 0:
+                return False
+            return max(0, size - length), size - 1
+        first = int(first)
+        last = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if first >= size or last < first:
+        return False
+    return first, min(last, size - 1)
+
+
+class _FileRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'NetworkAutomation'
+
+    def do_HEAD(self):
+        self.__serve(send_body=False)
+
+    def do_GET(self):
+        self.__serve(send_body=True)
+
+    def __serve(self, send_body):
+        start = monotonic()
+        path = self.server.file_server.local_path(self.path)
+        if path is None or not os.path.isfile(path):
+            self.send_error(404, 'File not found')
+            return
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            byte_range = _parse_range(self.headers.get('Range', ''), size)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{0}'.format(size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range is None:
+                first, last = 0, size - 1
+                self.send_response(200)
+            else:
+                first, last = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(first, last, size))
+            count = last - first + 1
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(count))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            sent = 0
+            if send_body and count > 0:
+                self.wfile.flush()
+                sent = self.__send_file(f, first, count)
+        self.server.file_server.record({'peer': '{0}:{1}'.format(*self.client_address[:2]),
+                                        'path': self.path,
+                                        'range': byte_range is not None,
+                                        'bytes': sent,
+                                        'seconds': monotonic() - start, })
+
+    def __send_file(self, f, offset, count):
+        """Send part of a file to the client, with sendfile() if available.
+
+        :return: Number of bytes sent.
+        :rtype: int
+        """
+        if hasattr(self.connection, 'sendfile'):
+            return self.connection.sendfile(f, offset, count)
+        f.seek(offset)
+        remaining = count
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            self.wfile.write(block)
+            remaining -= len(block)
+        return count - remaining
+
+    def log_message(self, message_format, *args):
+        # Transfers are recorded in HttpFileServer.transfers instead of printed
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Many devices may connect at the same time
+    request_queue_size = 128
+
+
+class HttpFileServer(object):
+    def __init__(self, root, host='0.0.0.0', port=0):
+        """Class instantiation.
+
+        :param str root: Directory to serve files from.
+        :param str host: Address to listen on.
+        :param int port: Port to listen on, or 0 for any free port.
+        :return: None
+        :rtype: None
+        :raise ValueError: If the root directory does not exist.
+        """
+        if not os.path.isdir(root):
+            raise ValueError('Invalid HTTP root directory: {0}.'.format(root))
+        self.root = os.path.realpath(root)
+        self.host = host
+        self.port = port
+        # Completed requests, most recent last
+        self.transfers = collections.deque(maxlen=1000)
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__thread = None
+
+    def relative_path(self, path):
+        """Get the path of a file relative to the root.
+
+        :param str path: Path of the file, absolute (under the root) or relative to the root.
+        :return: The path relative to the root, with forward slashes.
+        :rtype: str
+        :raise ValueError: If the path is outside the root.
+        """
+        local_path = os.path.realpath(path) if os.path.isabs(path) else None
+        if local_path is None or not local_path.startswith(self.root + os.sep):
+            local_path = os.path.realpath(os.path.join(self.root, path.lstrip('/')))
+        if not local_path.startswith(self.root + os.sep):
+            raise ValueError('{0} is outside the HTTP root directory.'.format(path))
+        return os.path.relpath(local_path, self.root).replace(os.sep, '/')
+
+    def local_path(self, url_path):
+        """Get the local path of a requested file.
+
+        :param str url_path: The path in the request (e.g., /images/c3745.bin).
+        :return: The path, or None if it is outside the root.
+        :rtype: str
+        """
+        url_path = unquote(url_path.split('?', 1)[0].split('#', 1)[0])
+        local_path = os.path.realpath(os.path.join(self.root, url_path.lstrip('/')))
+        if not local_path.startswith(self.root + os.sep):
+            return None
+        return local_path
+
+    def url(self, path, host_ip_addr):
+        """Get the URL of a file, for the device's copy command.
+
+        :param str path: Path of the file, absolute (under the root) or relative to the root.
+        :param str host_ip_addr: IP address of this host, as the device reaches it.
+        :return: The URL (e.g., http://192.168.1.10:8080/c3745.bin).
+        :rtype: str
+        :raise ValueError: If the path is outside the root.
+        """
+        return 'http://{0}:{1}/{2}'.format(host_ip_addr, self.port,
+                                           quote(self.relative_path(path)))
+
+    def record(self, result):
+        with self.__lock:
+            self.transfers.append(result)
+
+    def start(self):
+        """Run the server on threads of its own.
+
+        :return: The port the server listens on.
+        :rtype: int
+        :raise socket.error: If unable to listen on the port.
+        """
+        self.__server = _ThreadingHTTPServer((self.host, self.port), _FileRequestHandler)
+        self.__server.file_server = self
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         name='http-server')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self.port
+
+    def stop(self):
+        """Stop accepting requests. Transfers in progress end when their clients disconnect.
+
+        :return: None
+        :rtype: None
+        """
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__thread.join()
+            self.__server = None
+            self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
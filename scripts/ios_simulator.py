@@ -0,0 +1,840 @@
+# -*- coding: utf-8 -*-
+"""Simulated Cisco IOS devices, for repeatable benchmarks and load tests without real devices.
+
+Developer notes:
+
+- A simulated device reproduces the prompts and dialogs that CiscoIOS expects: startup
+  messages, Username: and Password: prompts, the enable password, configuration modes, copy,
+  delete, format, and reload dialogs, and --More-- paging. It keeps its hostname, terminal
+  length, configuration, and flash files for the life of the process.
+- Configuration commands are accepted without checking them, except for commands that start
+  with the word 'invalid', which are rejected, to exercise error handling. Unknown EXEC
+  commands are rejected the way IOS does.
+- Latency (a delay before each response) and the size of long output (e.g., show
+  tech-support) are configurable, so benchmarks can model slow consoles or large output.
+- Over TCP, each device listens on its own port, and speaks enough Telnet (WILL ECHO and
+  WILL SGA) for the telnet client. Hundreds of devices can run in one process, one thread
+  per connection. With --stdio, one device talks over standard input and output (e.g., for
+  pexpect.spawn()).
+- Unlike the other modules, this one can be run directly:
+
+    python ios_simulator.py --port 5001 --count 100
+    python ios_simulator.py --stdio --hostname R1 --latency 0.05
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+__all__ = ['DeviceProfile', 'SimulatedDevice', 'SimulatorServer', 'run_stdio', 'main', ]
+
+# Telnet protocol bytes (RFC 854)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+ECHO = 1
+SGA = 3
+
+# Configuration sub-modes, by the first word of the command that enters them
+SUB_MODES = {'interface': '(config-if)#',
+             'line': '(config-line)#',
+             'router': '(config-router)#',
+             'switch': '(config-switch)#',
+             'vlan': '(config-vlan)#',
+             'ip access-list': '(config-ext-nacl)#', }
+
+INVALID_INPUT = '% Invalid input detected at \'^\' marker.'
+
+
+class _Disconnected(Exception):
+    """The client closed the connection."""
+
+
+class DeviceProfile(object):
+    def __init__(self, hostname='R1',
+                 username=None,
+                 password=None,
+                 enable_password=None,
+                 latency=0.0,
+                 jitter=0.0,
+                 output_lines=1000,
+                 line_length=80,
+                 transfer_size=1024 * 1024,
+                 boot_delay=0.0,
+                 boot_messages=True,
+                 initial_dialog=False):
+        """Class instantiation. Settings for a simulated device.
+
+        :param str hostname: Initial hostname of the device.
+        :param str username: Username to ask for at login, or None to not ask.
+        :param str password: Password to ask for at login, or None to not ask.
+        :param str enable_password: Password for the enable command, or None to not ask.
+        :param float latency: Seconds to wait before each response.
+        :param float jitter: Most extra seconds, chosen at random, to wait before each response.
+        :param int output_lines: Number of lines of long output (e.g., show tech-support).
+        :param int line_length: Length of each line of long output.
+        :param int transfer_size: Size, in bytes, of files copied to the device.
+        :param float boot_delay: Seconds the device takes to boot (at the start and on reload).
+        :param bool boot_messages: True to show boot messages and wait for RETURN (like a
+            console line), or False to go straight to the login prompts (like a VTY line).
+        :param bool initial_dialog: True to offer the initial configuration dialog after boot.
+        :return: None
+        :rtype: None
+        """
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.enable_password = enable_password
+        self.latency = latency
+        self.jitter = jitter
+        self.output_lines = output_lines
+        self.line_length = line_length
+        self.transfer_size = transfer_size
+        self.boot_delay = boot_delay
+        self.boot_messages = boot_messages
+        self.initial_dialog = initial_dialog
+
+
+class SimulatedDevice(object):
+    """State of a simulated device that outlives its connections (e.g., its hostname, files,
+    and configuration).
+    """
+
+    def __init__(self, profile):
+        """Class instantiation.
+
+        :param DeviceProfile profile: The device's settings.
+        :return: None
+        :rtype: None
+        """
+        self.profile = profile
+        self.hostname = profile.hostname
+        self.running_config = []
+        self.saved_config = []
+        # Files on flash: size by name
+        self.files = {}
+        # Set by enable secret or enable password
+        self.enable_password = profile.enable_password
+        self.boot_time = time.time()
+        # Commands received, for benchmarks
+        self.commands = 0
+        self.lock = threading.Lock()
+
+
+class _Session(object):
+    """One connection to a simulated device. Reads commands and writes responses, using the
+    transport's read() and write().
+    """
+
+    def __init__(self, device, read, write):
+        self.device = device
+        self.profile = device.profile
+        self.__read = read
+        self.__write = write
+        self.__input = ''
+        # True after a CR, so the LF or NUL that may follow it is not read as an empty line
+        self.__skip_lf = False
+        self.mode = '>'
+        self.page_length = 24
+        self.rng = random.Random()
+
+    # Input and output
+
+    def write(self, text):
+        self.__write(text.replace('\n', '\r\n'))
+
+    def pause(self):
+        delay = self.profile.latency
+        if self.profile.jitter:
+            delay += self.rng.uniform(0, self.profile.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def __fill(self):
+        data = self.__read()
+        if not data:
+            raise _Disconnected()
+        self.__input += data
+
+    def read_line(self, echo=True):
+        """Read a line, echoing it (IOS echoes input; the client does not).
+        """
+        while True:
+            if self.__input and self.__skip_lf:
+                if self.__input[0] in '\n\0':
+                    self.__input = self.__input[1:]
+                self.__skip_lf = False
+            match = re.search('[\r\n]', self.__input)
+            if match is not None:
+                break
+            self.__fill()
+        line, self.__input = self.__input[:match.start()], self.__input[match.end():]
+        self.__skip_lf = match.group(0) == '\r'
+        # Apply backspaces
+        while '\x08' in line or '\x7f' in line:
+            line = re.sub('[^\x08\x7f]?[\x08\x7f]', '', line, count=1)
+        self.__write((line if echo else '') + '\r\n')
+        return line.strip()
+
+    def read_key(self):
+        while True:
+            if self.__input and self.__skip_lf:
+                if self.__input[0] in '\n\0':
+                    self.__input = self.__input[1:]
+                self.__skip_lf = False
+            if self.__input:
+                break
+            self.__fill()
+        key, self.__input = self.__input[0], self.__input[1:]
+        self.__skip_lf = key == '\r'
+        return key
+
+    def ask(self, question, echo=True):
+        self.pause()
+        self.write(question)
+        return self.read_line(echo=echo)
+
+    def page(self, lines):
+        """Write lines of output, pausing at --More-- every page_length lines.
+
+        :return: False if the user stopped the output at a --More-- prompt.
+        """
+        block = []
+        for n, line in enumerate(lines, 1):
+            block.append(line)
+            if self.page_length and n % (self.page_length - 1) == 0:
+                self.write('\n'.join(block) + '\n --More-- ')
+                block = []
+                key = self.read_key()
+                self.write('\x08' * 10 + ' ' * 10 + '\x08' * 10)
+                if key not in ' \r\n':
+                    return False
+            elif len(block) >= 256:
+                self.write('\n'.join(block) + '\n')
+                block = []
+        if block:
+            self.write('\n'.join(block) + '\n')
+        return True
+
+    @property
+    def prompt(self):
+        return self.device.hostname + self.mode
+
+    # Session flow
+
+    def run(self):
+        try:
+            if self.profile.boot_messages:
+                self.boot()
+            while self.login():
+                self.exec_loop()
+                if not self.profile.boot_messages:
+                    # A VTY session ends when the user exits
+                    return
+                self.write('\n{0} con0 is now available\n\n\n\n\n'
+                           'Press RETURN to get started.\n\n'.format(self.device.hostname))
+                self.read_line(echo=False)
+        except _Disconnected:
+            return
+
+    def boot(self):
+        if self.profile.boot_delay:
+            time.sleep(self.profile.boot_delay)
+        self.device.boot_time = time.time()
+        self.write('\nInitializing memory for ECC\n'
+                   'Cisco IOS Software, 3700 Software (C3745-ADVENTERPRISEK9-M), '
+                   'Version 12.4(25d), RELEASE SOFTWARE (fc1)\n'
+                   'Copyright (c) 1986-2010 by Cisco Systems, Inc.\n\n')
+        if self.profile.initial_dialog and not self.device.saved_config:
+            answer = self.ask('\n         --- System Configuration Dialog ---\n\n'
+                              'Would you like to enter the initial configuration dialog? '
+                              '[yes/no]: ')
+            while answer.lower() not in ('no', 'n', ):
+                answer = self.ask('Would you like to enter the initial configuration dialog? '
+                                  '[yes/no]: ')
+        self.write('\n\nPress RETURN to get started!\n\n')
+        self.read_line(echo=False)
+
+    def login(self):
+        """Ask for the credentials, if any. Returns False after three failures."""
+        if self.profile.username is None and self.profile.password is None:
+            self.mode = '>'
+            return True
+        self.write('\n\nUser Access Verification\n\n')
+        for _ in range(3):
+            username = None
+            if self.profile.username is not None:
+                username = self.ask('Username: ')
+            password = self.ask('Password: ', echo=False)
+            if username == self.profile.username and password == self.profile.password:
+                self.mode = '>'
+                return True
+            self.write('% Login invalid\n\n' if username is not None else '% Bad passwords\n')
+        return False
+
+    def exec_loop(self):
+        """Read and run commands until the user exits."""
+        while True:
+            self.pause()
+            self.write(self.prompt)
+            line = self.read_line()
+            with self.device.lock:
+                self.device.commands += 1
+            if not line or line.startswith(('!', ';', )):
+                # Empty lines and comments (e.g., CiscoIOS tracer rounds) only show the prompt
+                continue
+            if self.mode.startswith('('):
+                self.config_command(line)
+            elif self.exec_command(line) is False:
+                return
+
+    # Commands
+
+    def config_command(self, line):
+        words = line.split()
+        if line.startswith('do '):
+            self.exec_command(line[3:].strip())
+            return
+        if words[0] == 'end':
+            self.mode = '#'
+            return
+        if words[0] == 'exit':
+            self.mode = '(config)#' if self.mode != '(config)#' else '#'
+            return
+        if words[0] == 'invalid':
+            self.invalid(line)
+            return
+        with self.device.lock:
+            self.device.running_config.append(line)
+        if words[0] == 'hostname' and len(words) > 1:
+            self.device.hostname = words[1]
+        elif words[0] == 'enable' and words[1:2] in (['secret'], ['password'], ):
+            self.device.enable_password = words[-1]
+        elif words[0] == 'crypto' and words[1:3] == ['key', 'zeroize']:
+            answer = self.ask('% All keys will be removed.\n'
+                              'Do you really want to remove these keys? [yes/no]: ')
+            if answer.lower().startswith('y'):
+                self.write('% All RSA keys have been removed.\n')
+        elif words[0] == 'crypto' and words[1:3] == ['key', 'generate']:
+            modulus = words[words.index('modulus') + 1] if 'modulus' in words else '1024'
+            self.write('The name for the keys will be: {0}\n\n% The key modulus size is {1} '
+                       'bits\n% Generating {1} bit RSA keys, keys will be non-exportable...\n'
+                       '[OK] (elapsed time was 1 seconds)\n\n'.format(self.device.hostname,
+                                                                      modulus))
+        elif words[0] == 'switch' and 'priority' in words:
+            answer = self.ask('Changing the Switch Priority of Switch Number {0} to {1}\n'
+                              'Do you want to continue?[confirm]'.format(words[1], words[-1]))
+            if answer.lower() not in ('n', 'no', ):
+                self.write('New Priority has been set successfully\n')
+        elif line.startswith('ip access-list'):
+            self.mode = SUB_MODES['ip access-list']
+        elif words[0] in SUB_MODES and words[0] != 'switch':
+            self.mode = SUB_MODES[words[0]]
+
+    def invalid(self, line):
+        self.write('{0}^\n{1}\n\n'.format(' ' * len(self.prompt), INVALID_INPUT))
+
+    def exec_command(self, line):
+        """Run an EXEC command. Returns False if the session ends."""
+        words = line.split()
+        command = words[0].lower()
+        privileged = self.mode == '#'
+        if command in ('exit', 'logout', 'quit', ):
+            return False
+        if command in ('en', 'enable', ):
+            if self.device.enable_password is not None and not privileged:
+                for _ in range(3):
+                    if self.ask('Password: ', echo=False) == self.device.enable_password:
+                        break
+                else:
+                    self.write('% Bad secrets\n\n')
+                    return True
+            self.mode = '#'
+        elif command == 'disable':
+            self.mode = '>'
+        elif command in ('terminal', 'term', ) and len(words) > 2:
+            if words[1].startswith('len'):
+                self.page_length = int(words[2])
+        elif not privileged and command not in ('show', 'sh', 'ping', ):
+            self.invalid(line)
+        elif command in ('configure', 'conf', ) and len(words) > 1 and words[1] == 'replace':
+            self.configure_replace(words)
+        elif command in ('configure', 'conf', ):
+            self.write('Enter configuration commands, one per line.  End with CNTL/Z.\n')
+            self.mode = '(config)#'
+        elif command in ('show', 'sh', ) and len(words) > 1:
+            self.show(words[1:])
+        elif command == 'copy' and len(words) == 3:
+            self.copy(words[1], words[2])
+        elif command == 'delete':
+            self.delete(words)
+        elif command == 'dir':
+            self.show_file_system(words[1] if len(words) > 1 else 'flash:')
+        elif command == 'verify' and len(words) == 3 and words[1] in ('/md5', '/sha512', ):
+            self.verify(words[1][1:], words[2])
+        elif command == 'format' and len(words) > 1:
+            self.format(words[1])
+        elif command == 'reload':
+            answer = self.ask('Proceed with reload? [confirm]')
+            if answer.lower() not in ('n', 'no', ):
+                self.write('\n*** System going down ***\n\n')
+                self.boot()
+                self.login()
+                self.mode = '>'
+        elif command == 'ping' and len(words) > 1:
+            count = int(words[words.index('repeat') + 1]) if 'repeat' in words else 5
+            self.write('Type escape sequence to abort.\nSending {0}, 100-byte ICMP Echos to {1}, '
+                       'timeout is 2 seconds:\n{2}\nSuccess rate is 100 percent ({0}/{0}), '
+                       'round-trip min/avg/max = 1/2/4 ms\n'.format(count, words[1], '!' * count))
+        elif command == 'clock':
+            pass
+        else:
+            self.invalid(line)
+        return True
+
+    def show(self, args):
+        what = args[0].lower()
+        if 'version'.startswith(what):
+            self.page(self.show_version().split('\n'))
+        elif 'inventory'.startswith(what):
+            self.write('NAME: "3745 chassis", DESCR: "3745 chassis"\n'
+                       'PID: 3745              , VID: 1.0, SN: FTX0945W0MY\n\n')
+        elif 'running-config'.startswith(what) or 'startup-config'.startswith(what):
+            config = (self.device.running_config if what.startswith('r')
+                      else self.device.saved_config)
+            lines = (['Building configuration...', '', 'Current configuration:', '!',
+                      'hostname {0}'.format(self.device.hostname), '!'] + list(config) +
+                     ['!', 'end', ''])
+            self.page(lines)
+        elif what.endswith(':'):
+            self.show_file_system(what)
+        elif 'clock'.startswith(what):
+            self.write(time.strftime('*%H:%M:%S.000 UTC %a %b %d %Y\n', time.gmtime()))
+        else:
+            # Long output (e.g., show tech-support, show logging)
+            filler = ('x' * self.profile.line_length)
+            self.page('{0:>6} {1}'.format(n, filler)[:self.profile.line_length]
+                      for n in range(self.profile.output_lines))
+
+    def show_version(self):
+        minutes = int(time.time() - self.device.boot_time) // 60
+        return ('Cisco IOS Software, 3700 Software (C3745-ADVENTERPRISEK9-M), Version 12.4(25d), '
+                'RELEASE SOFTWARE (fc1)\n'
+                'Technical Support: http://www.cisco.com/techsupport\n'
+                'Copyright (c) 1986-2010 by Cisco Systems, Inc.\n\n'
+                'ROM: ROMMON Emulation Microcode\n\n'
+                '{0} uptime is {1} hours, {2} minutes\n'
+                'System image file is "flash:c3745-adventerprisek9-mz.124-25d.bin"\n\n'
+                'Cisco 3745 (R7000) processor (revision 2.0) with 249856K/12288K bytes of '
+                'memory.\n'
+                'Processor board ID FTX0945W0MY\n'
+                '2 FastEthernet interfaces\n'
+                '151K bytes of NVRAM.\n'
+                '125440K bytes of ATA System CompactFlash (Read/Write)\n\n'
+                'Configuration register is 0x2102\n'.format(self.device.hostname,
+                                                           minutes // 60, minutes % 60))
+
+    def show_file_system(self, file_system):
+        lines = ['Directory of {0}/'.format(file_system.rstrip(':') + ':'), '']
+        for n, (name, size) in enumerate(sorted(self.device.files.items()), 1):
+            lines.append('{0:>4}  -rw-  {1:>12}  Mar 1 2002 00:00:00 +00:00  {2}'.format(
+                n, size, name))
+        used = sum(self.device.files.values())
+        lines += ['', '128573440 bytes total ({0} bytes free)'.format(128573440 - used),
+                  '{0} bytes available ({1} bytes used)'.format(128573440 - used, used), '']
+        self.page(lines)
+
+    def file_hash(self, algorithm, name):
+        # Stands in for the contents of the file
+        return hashlib.new(algorithm, '{0}:{1}'.format(name, self.device.files[name]).encode(
+            'utf-8')).hexdigest()
+
+    @staticmethod
+    def split_path(path):
+        """Split a device path (e.g., flash:/R1.cfg) into the file system and file name."""
+        file_system, _, name = path.partition(':')
+        return file_system, name.lstrip('/')
+
+    @staticmethod
+    def fetch(url):
+        """Get a file from an HTTP server, so HTTP transfers can be tested against a real
+        server. Only the size is kept.
+
+        :return: Number of bytes received, or None if the file could not be read.
+        """
+        try:
+            response = urlopen(url, timeout=60)
+            size = 0
+            while True:
+                block = response.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+            response.close()
+            return size
+        except (IOError, OSError, ValueError):
+            return None
+
+    def verify(self, algorithm, path):
+        _, name = self.split_path(path)
+        if name not in self.device.files:
+            self.write('%Error opening {0} (No such file or directory)\n'.format(path))
+            return
+        self.write('.' * 20 + 'Done!\nverify /{0} ({1}) = {2}\n\n'.format(
+            algorithm, path, self.file_hash(algorithm, name)))
+
+    def delete(self, words):
+        paths = [w for w in words[1:] if not w.startswith('/')]
+        if not paths:
+            self.invalid(' '.join(words))
+            return
+        _, name = self.split_path(paths[0])
+        if '/force' not in words:
+            self.ask('Delete filename [{0}]? '.format(name))
+            self.ask('Delete {0}? [confirm]'.format(paths[0]))
+        if self.device.files.pop(name, None) is None:
+            self.write('%Error deleting {0} (No such file or directory)\n'.format(paths[0]))
+
+    def format(self, file_system):
+        self.ask('Format operation may take a while. Continue? [confirm]')
+        self.ask('Format operation will destroy all data in "{0}".  Continue? '
+                 '[confirm]'.format(file_system))
+        self.ask('Enter volume ID (up to 64 chars)[default {0}]: '.format(
+            file_system.rstrip(':')))
+        self.device.files.clear()
+        self.write('Format of {0} complete\n'.format(file_system))
+
+    def configure_replace(self, words):
+        _, name = self.split_path(words[2]) if len(words) > 2 else ('', '')
+        if name not in self.device.files:
+            self.write('%Error opening {0} (No such file or directory)\n'.format(words[2]))
+            return
+        self.write('Total number of passes: 1\nRollback Done\n\n')
+
+    def copy(self, source, destination):
+        if source.startswith('run') and destination.startswith('start'):
+            self.ask('Destination filename [startup-config]? ')
+            self.write('Building configuration...\n')
+            self.pause()
+            self.device.saved_config = list(self.device.running_config)
+            self.write('[OK]\n')
+            return
+        source_scheme = source.partition(':')[0]
+        destination_scheme = destination.partition(':')[0]
+        remote = [s for s in (source_scheme, destination_scheme)
+                  if s in ('scp', 'ftp', 'tftp', 'http', )]
+        if destination.startswith('run'):
+            # Merge a file into the running configuration
+            _, name = self.split_path(source)
+            self.ask('Destination filename [running-config]? ')
+            if name not in self.device.files:
+                self.write('%Error opening {0} (No such file or directory)\n'.format(source))
+                return
+            self.write('{0} bytes copied in 0.100 secs ({1} bytes/sec)\n'.format(
+                self.device.files[name], self.device.files[name] * 10))
+            return
+        if not remote:
+            self.invalid('copy {0} {1}'.format(source, destination))
+            return
+        scheme = remote[0]
+        upload = destination_scheme not in ('scp', 'ftp', 'tftp', 'http', )
+        # Ask for the remote host and file, with any given in the URL as the default
+        url = source if upload else destination
+        url_path = url.partition(':')[2].lstrip('/')
+        host = url_path.split('/')[0] if url_path else ''
+        if '@' in host:
+            host = host.split('@', 1)[1]
+        self.ask('Address or name of remote host [{0}]? '.format(host))
+        if scheme == 'scp' and '@' not in url:
+            self.ask('{0} username [admin]? '.format('Source' if upload else 'Destination'))
+        if upload:
+            remote_name = url_path.split('/', 1)[1] if '/' in url_path else ''
+            if not remote_name:
+                remote_name = self.ask('Source filename []? ')
+            _, name = self.split_path(destination)
+            name = self.ask('Destination filename [{0}]? '.format(
+                name or remote_name.split('/')[-1])) or name or remote_name.split('/')[-1]
+            if name in self.device.files:
+                self.ask('%Warning:There is a file already existing with this name\n'
+                         'Do you want to over write? [confirm]')
+            if scheme == 'http':
+                size = self.fetch(url)
+                if size is None:
+                    self.write('%Error opening {0} (No such file or directory)\n'.format(url))
+                    return
+            else:
+                size = self.profile.transfer_size
+        else:
+            _, name = self.split_path(source)
+            if not name:
+                name = self.ask('Source filename []? ')
+            remote_name = url_path.split('/', 1)[1] if '/' in url_path else ''
+            self.ask('Destination filename [{0}]? '.format(remote_name or name.split('/')[-1]))
+            if name not in self.device.files:
+                self.write('%Error opening {0}{1} (No such file or directory)\n'.format(
+                    source.partition(':')[0] + ':', name))
+                return
+            size = self.device.files[name]
+        if scheme == 'scp':
+            self.ask('Password: ', echo=False)
+        self.pause()
+        self.write('Accessing {0}...\n{1}\n'.format(url, '!' * max(1, min(40, size // 65536))))
+        if upload:
+            self.device.files[name] = size
+        self.write('{0} bytes copied in 1.000 secs ({0} bytes/sec)\n'.format(size))
+
+
+class _TelnetConnection(object):
+    """Telnet option handling for a simulated device's socket. Removes Telnet commands from the
+    input, and refuses every option except echo and suppress go-ahead.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.__pending = bytearray()
+
+    def start(self):
+        # The device echoes input, and does not use go-aheads (i.e., character mode)
+        self.sock.sendall(bytes(bytearray([IAC, WILL, ECHO, IAC, WILL, SGA])))
+
+    def read(self):
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except socket.error:
+                return ''
+            if not data:
+                return ''
+            text = self.__filter(bytearray(data))
+            if text:
+                return text
+
+    def __filter(self, data):
+        data = self.__pending + data
+        self.__pending = bytearray()
+        out = bytearray()
+        replies = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                out.append(byte)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self.__pending = data[i:]
+                break
+            command = data[i + 1]
+            if command == IAC:
+                out.append(IAC)
+                i += 2
+            elif command in (WILL, WONT, DO, DONT):
+                if i + 2 >= len(data):
+                    self.__pending = data[i:]
+                    break
+                option = data[i + 2]
+                if command == WILL:
+                    replies += bytearray([IAC, DONT, option])
+                elif command == DO and option not in (ECHO, SGA):
+                    replies += bytearray([IAC, WONT, option])
+                i += 3
+            elif command == SB:
+                end = data.find(bytearray([IAC, SE]), i)
+                if end == -1:
+                    self.__pending = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        if replies:
+            self.sock.sendall(bytes(replies))
+        return bytes(out).decode('latin-1')
+
+    def write(self, text):
+        try:
+            self.sock.sendall(text.encode('utf-8'))
+        except socket.error:
+            raise _Disconnected()
+
+
+class _DeviceRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = _TelnetConnection(self.request)
+        try:
+            connection.start()
+        except socket.error:
+            return
+        _Session(self.server.device, connection.read, connection.write).run()
+
+
+class _DeviceServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 64
+
+
+class SimulatorServer(object):
+    def __init__(self, profiles, host='127.0.0.1', base_port=5001):
+        """Class instantiation.
+
+        :param list profiles: One DeviceProfile per device.
+        :param str host: Address to listen on.
+        :param int base_port: Port of the first device; each device after it uses the next
+            port.
+        :return: None
+        :rtype: None
+        """
+        self.host = host
+        self.base_port = base_port
+        self.devices = [SimulatedDevice(p) for p in profiles]
+        self.__servers = []
+
+    def start(self):
+        """Start listening, one port and thread per device.
+
+        :return: The port of each device, in order.
+        :rtype: list
+        """
+        ports = []
+        for n, device in enumerate(self.devices):
+            port = self.base_port + n if self.base_port else 0
+            server = _DeviceServer((self.host, port), _DeviceRequestHandler)
+            server.device = device
+            thread = threading.Thread(target=server.serve_forever,
+                                      name='ios-simulator-{0}'.format(device.hostname))
+            thread.daemon = True
+            thread.start()
+            self.__servers.append(server)
+            ports.append(server.server_address[1])
+        return ports
+
+    def stop(self):
+        for server in self.__servers:
+            server.shutdown()
+            server.server_close()
+        self.__servers = []
+
+
+def run_stdio(profile):
+    """Simulate a device on standard input and output (e.g., in a pseudo-terminal).
+
+    :param DeviceProfile profile: The device's settings.
+    :return: None
+    :rtype: None
+    """
+    stdin, stdout = sys.stdin.fileno(), sys.stdout.fileno()
+    saved_attributes = None
+    if os.isatty(stdin):
+        import termios
+        import tty
+        saved_attributes = termios.tcgetattr(stdin)
+        # Read each key as it is typed, without local echo or CR and LF translation
+        tty.setcbreak(stdin)
+        attributes = termios.tcgetattr(stdin)
+        attributes[0] &= ~termios.ICRNL
+        attributes[1] &= ~termios.ONLCR
+        termios.tcsetattr(stdin, termios.TCSANOW, attributes)
+
+    def read():
+        return os.read(stdin, 4096).decode('latin-1')
+
+    def write(text):
+        data = text.encode('utf-8')
+        while data:
+            data = data[os.write(stdout, data):]
+
+    try:
+        _Session(SimulatedDevice(profile), read, write).run()
+    finally:
+        if saved_attributes is not None:
+            termios.tcsetattr(stdin, termios.TCSADRAIN, saved_attributes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulated Cisco IOS devices.')
+    parser.add_argument('--stdio', action='store_true',
+                        help='simulate one device on standard input and output')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5001, help='port of the first device')
+    parser.add_argument('--count', type=int, default=1, help='number of devices')
+    parser.add_argument('--hostname', default='R1',
+                        help='hostname, or hostname prefix when --count is more than 1')
+    parser.add_argument('--username', help='username to ask for at login')
+    parser.add_argument('--password', help='password to ask for at login')
+    parser.add_argument('--enable-password', help='password for the enable command')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='most extra seconds to wait before each response')
+    parser.add_argument('--output-lines', type=int, default=1000,
+                        help='number of lines of long output (e.g., show tech-support)')
+    parser.add_argument('--line-length', type=int, default=80,
+                        help='length of each line of long output')
+    parser.add_argument('--transfer-size', type=int, default=1024 * 1024,
+                        help='size of files copied to the devices, in bytes')
+    parser.add_argument('--boot-delay', type=float, default=0.0,
+                        help='seconds to boot at the start and on reload')
+    parser.add_argument('--vty', action='store_true',
+                        help='act like a VTY line (no boot messages)')
+    parser.add_argument('--initial-dialog', action='store_true',
+                        help='offer the initial configuration dialog after boot')
+    args = parser.parse_args(argv)
+
+    def profile(hostname):
+        return DeviceProfile(hostname=hostname,
+                             username=args.username,
+                             password=args.password,
+                             enable_password=args.enable_password,
+                             latency=args.latency,
+                             jitter=args.jitter,
+                             output_lines=args.output_lines,
+                             line_length=args.line_length,
+                             transfer_size=args.transfer_size,
+                             boot_delay=args.boot_delay,
+                             boot_messages=not args.vty,
+                             initial_dialog=args.initial_dialog)
+
+    if args.stdio:
+        run_stdio(profile(args.hostname))
+        return
+    if args.count > 1:
+        hostnames = ['{0}{1}'.format(args.hostname.rstrip('0123456789'), n)
+                     for n in range(1, args.count + 1)]
+    else:
+        hostnames = [args.hostname]
+    server = SimulatorServer([profile(h) for h in hostnames], args.host, args.port)
+    ports = server.start()
+    print('Simulating {0} device(s) on {1}, ports {2}-{3}. Press Ctrl+C to stop.'.format(
+        len(ports), args.host, ports[0], ports[-1]))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Adaptive send pacing for device sessions.
+
+Developer notes:
+
+- pexpect waits child.delaybeforesend seconds before every send. A fixed delay (e.g., 0.5
+  seconds) protects slow consoles, but adds minutes to large configuration pushes on fast
+  virtual teletype (VTY) lines.
+- The pacer starts from a delay based on the device's measured prompt latency, backs off
+  when the device shows signs of lost or garbled characters (error messages, time-outs, or an
+  echo that differs from the line sent), and eases back down after a run of clean responses.
+- Comparing the echo catches characters lost from lines the device still accepts (e.g., a
+  description or a password), which produce no error message.
+"""
+import re
+import sys
+
+__all__ = ['SendPacer', 'echo_differs', ]
+
+# Device responses that usually mean the device did not receive what was sent
+GARBLED_INPUT_MARKERS = ('% Invalid input detected',
+                         '% Incomplete command',
+                         '% Ambiguous command',
+                         '% Unknown command',
+                         '% Unrecognized command', )
+
+# The first non-empty line of a response (i.e., the device's echo of the command)
+_ECHO = re.compile(r'[\r\n]*([^\n]*)')
+
+
+def echo_differs(sent, response):
+    """Check if the device's echo of a line differs from the line that was sent.
+
+    :param str sent: The line that was sent, with or without the EOL.
+    :param str response: Output from the device after the line was sent, starting with the echo.
+    :return: True if the echo differs. False if it matches, if nothing visible was sent, or if
+        the device edited the echo of a long line (e.g., scrolled it with a leading '$').
+    :rtype: bool
+    """
+    sent = sent.strip()
+    if not sent:
+        return False
+    echo = _ECHO.match(response).group(1).strip()
+    if echo.startswith('$') or '\x08' in echo:
+        return False
+    return echo != sent
+
+
+class SendPacer(object):
+    def __init__(self, fixed_delay=0.5,
+                 min_delay=0.0,
+                 max_delay=2.0,
+                 latency_factor=0.25,
+                 backoff_factor=2.0,
+                 backoff_floor=0.05,
+                 recovery_responses=20):
+        """Class instantiation.
+
+        :param float fixed_delay: The fixed delay the pacer replaces. Used as the delay until
+            calibration, and as the baseline for the time saved.
+        :param float min_delay: Shortest delay before a send, in seconds.
+        :param float max_delay: Longest delay before a send, in seconds.
+        :param float latency_factor: Fraction of the measured prompt latency to wait before
+            each send.
+        :param float backoff_factor: Multiplier applied to the delay when garbled input is
+            detected.
+        :param float backoff_floor: Smallest delay after a back off, in seconds, so backing off
+            from a near-zero delay has an effect.
+        :param int recovery_responses: Number of clean responses in a row before easing the
+            delay back toward the calibrated delay.
+        :return: None
+        :rtype: None
+        :raise ValueError: If an argument is invalid.
+        """
+        if not 0 <= min_delay <= max_delay:
+            raise ValueError('Invalid delay range.')
+        self.fixed_delay = fixed_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latency_factor = latency_factor
+        self.backoff_factor = backoff_factor
+        self.backoff_floor = backoff_floor
+        self.recovery_responses = recovery_responses
+        self.base_delay = self.__clamp(fixed_delay)
+        self.delay = self.base_delay
+        self.latency = None
+        self.__clean_responses = 0
+        # Counters
+        self.sends = 0
+        self.throttled_sends = 0
+        self.throttled_seconds = 0.0
+        self.backoffs = 0
+
+    def __clamp(self, delay):
+        return max(self.min_delay, min(self.max_delay, delay))
+
+    def calibrate(self, latencies):
+        """Set the delay from measured prompt latencies (i.e., the time between sending an EOL
+        and receiving the prompt).
+
+        :param list latencies: Measured latencies, in seconds.
+        :return: None
+        :rtype: None
+        """
+        if not latencies:
+            return
+        latencies = sorted(latencies)
+        self.latency = latencies[len(latencies) // 2]
+        self.base_delay = self.__clamp(self.latency * self.latency_factor)
+        self.delay = self.base_delay
+        self.__clean_responses = 0
+
+    def next_delay(self):
+        """Count a send and get the delay to use before it.
+
+        :return: The delay, in seconds, or None for no delay (as pexpect expects).
+        :rtype: float
+        """
+        self.sends += 1
+        if self.delay <= 0:
+            return None
+        self.throttled_sends += 1
+        self.throttled_seconds += self.delay
+        return self.delay
+
+    def check_response(self, response, sent=None):
+        """Back off if the device's response shows signs of garbled input (an error message,
+        or an echo that differs from the line sent); otherwise, count a clean response.
+
+        :param response: Output from the device between a command and the next prompt.
+        :param str sent: The line sent before the response, to compare with the device's echo,
+            or None to not compare (e.g., the device does not echo passwords).
+        :return: True if the response looked clean.
+        :rtype: bool
+        """
+        if isinstance(response, bytes) and not isinstance(response, str):
+            response = response.decode('utf-8', 'replace')
+        if (any(m in response for m in GARBLED_INPUT_MARKERS) or
+                (sent is not None and echo_differs(sent, response))):
+            self.backoff()
+            return False
+        self.__clean_responses += 1
+        if self.__clean_responses >= self.recovery_responses and self.delay > self.base_delay:
+            self.delay = max(self.base_delay, self.delay / self.backoff_factor)
+            self.__clean_responses = 0
+        return True
+
+    def backoff(self):
+        """Increase the delay (e.g., after a time-out or garbled input).
+
+        :return: None
+        :rtype: None
+        """
+        self.backoffs += 1
+        self.__clean_responses = 0
+        self.delay = self.__clamp(max(self.backoff_floor, self.delay * self.backoff_factor))
+
+    @property
+    def seconds_saved(self):
+        """Time saved compared to waiting fixed_delay before every send.
+
+        :rtype: float
+        """
+        return self.sends * self.fixed_delay - self.throttled_seconds
+
+    def stats(self):
+        """Get the pacing counters.
+
+        :rtype: dict
+        """
+        return {'sends': self.sends,
+                'throttled_sends': self.throttled_sends,
+                'throttled_seconds': self.throttled_seconds,
+                'seconds_saved': self.seconds_saved,
+                'backoffs': self.backoffs,
+                'latency': self.latency,
+                'base_delay': self.base_delay,
+                'delay': self.delay, }
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""Record device sessions, and replay them without the device.
+
+Developer notes:
+
+- A SessionRecorder saves everything a pexpect child sends and reads, with the time of each
+  event, as JSON lines. Reads are recorded as they come from the connection, before any escape
+  filter, and read timeouts and the end of the session (EOF) are recorded as well.
+- A ReplayChild stands in for pexpect.spawn: it serves the recorded reads, in order, and checks
+  each send against the recorded sends. Pass it to CiscoIOS.connect_via_child() and run the
+  same methods, in the same order, as the recorded session (e.g., get_device_info(),
+  reload_device(), or a transfer).
+- By default, the replay runs as fast as possible, so the time spent is the time spent in
+  CiscoIOS and pexpect (e.g., parsing and control flow). Set speed to replay the device's timing
+  (e.g., speed=1.0 for the recorded timing, or 10.0 for ten times faster).
+- The first line of a recording is a header, with the hostname, the start time, and the
+  encoding of the child (None for bytes). Each other line is an event:
+  {"t": <seconds since the start>, "event": "send"|"read"|"timeout"|"eof", "data": <text>}.
+  Bytes are saved as Latin-1 text, so every byte value is kept.
+"""
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pexpect
+from pexpect.spawnbase import SpawnBase
+
+__all__ = ['SessionRecorder', 'ReplayChild', 'ReplayMismatch', ]
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+# Control characters for sendcontrol() that are not letters (the same as pexpect.spawn)
+_CONTROL_CHARACTERS = {'@': 0, '`': 0, '[': 27, '{': 27, '\\': 28, '|': 28, ']': 29, '}': 29,
+                       '^': 30, '~': 30, '_': 31, '?': 127, }
+
+
+def _to_text(data):
+    """Convert the data of an event to text, for JSON.
+    """
+    if isinstance(data, bytes):
+        return data.decode('latin-1')
+    return data
+
+
+class ReplayMismatch(pexpect.ExceptionPexpect):
+    """The replayed session did not send what the recorded session sent.
+    """
+
+
+class SessionRecorder(object):
+    # Sessions recorded by this process, for unique file names
+    __counter = 0
+    __counter_lock = threading.Lock()
+
+    def __init__(self, hostname, directory='.'):
+        """Class instantiation. The recording is saved to
+        '<directory>/<hostname>-<UTC time>-<process ID>-<counter>.replay.jsonl'.
+
+        :param str hostname: Hostname of the device.
+        :param str directory: Directory for the recording.
+        :return: None
+        :rtype: None
+        """
+        with SessionRecorder.__counter_lock:
+            SessionRecorder.__counter += 1
+            counter = SessionRecorder.__counter
+        started = datetime.utcnow()
+        self.hostname = hostname
+        self.path = os.path.join(directory, '{0}-{1}-{2}-{3}.replay.jsonl'.format(
+            hostname, started.strftime('%y%m%d-%H%M%SZ'), os.getpid(), counter))
+        self.__file = io.open(self.path, 'w', encoding='utf-8')
+        self.__lock = threading.Lock()
+        self.__start = None
+        self.__started = started
+        self.events = 0
+
+    def __write(self, record):
+        line = json.dumps(record, ensure_ascii=False, sort_keys=True)
+        if not isinstance(line, type(u'')):
+            line = line.decode('utf-8')
+        self.__file.write(line + u'\n')
+
+    def __record(self, event, data=None):
+        with self.__lock:
+            if self.__file is None:
+                return
+            record = {'t': round(monotonic() - self.__start, 6), 'event': event, }
+            if data is not None:
+                record['data'] = _to_text(data)
+            self.__write(record)
+            self.events += 1
+
+    def attach(self, child):
+        """Record the sends and reads of a pexpect child, from now on. Attach the recorder
+        before any other wrapper of read_nonblocking() (e.g., an escape filter), so the
+        recording keeps the output as it came from the connection.
+
+        :param pexpect.spawn child: Connection in a child application object.
+        :return: None
+        :rtype: None
+        """
+        self.__start = monotonic()
+        self.__write({'hostname': self.hostname,
+                      'started': self.__started.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                      'encoding': child.encoding, })
+        send = child.send
+        read_nonblocking = child.read_nonblocking
+
+        def recorded_send(s):
+            self.__record('send', s)
+            return send(s)
+
+        def recorded_read_nonblocking(size=1, timeout=-1):
+            try:
+                data = read_nonblocking(size, timeout)
+            except pexpect.TIMEOUT:
+                self.__record('timeout')
+                raise
+            except pexpect.EOF:
+                self.__record('eof')
+                raise
+            self.__record('read', data)
+            return data
+
+        child.send = recorded_send
+        child.read_nonblocking = recorded_read_nonblocking
+
+    def close(self):
+        """Save the rest of the recording and close it. The child is not closed.
+
+        :return: None
+        :rtype: None
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+
+class ReplayChild(SpawnBase):
+    """A pexpect child that replays a recorded session.
+    """
+
+    def __init__(self, path, speed=None, strict=True, timeout=30, maxread=2000,
+                 searchwindowsize=None, logfile=None):
+        """Class instantiation.
+
+        :param str path: Path of the recording (see SessionRecorder).
+        :param float speed: Speed of the replay compared to the recorded session (e.g., 1.0 for
+            the recorded timing, or 10.0 for ten times faster), or None to replay as fast as
+            possible.
+        :param bool strict: True to raise ReplayMismatch if a send is not the same as the
+            recorded send, or False to ignore the difference.
+        :param int timeout: Default timeout of expect(), in seconds.
+        :param int maxread: Most bytes or characters per read.
+        :param int searchwindowsize: Size of the search window of expect(), or None for the
+            whole buffer.
+        :param logfile: Stream for the session's output, or None.
+        :return: None
+        :rtype: None
+        :raise ValueError: If the file is not a recording.
+        """
+        with io.open(path, 'r', encoding='utf-8') as recording:
+            lines = [json.loads(line) for line in recording if line.strip()]
+        if not lines or 'encoding' not in lines[0]:
+            raise ValueError('{0} is not a session recording.'.format(path))
+        header, events = lines[0], lines[1:]
+        super(ReplayChild, self).__init__(timeout=timeout, maxread=maxread,
+                                          searchwindowsize=searchwindowsize, logfile=logfile,
+                                          encoding=header['encoding'])
+        self.hostname = header.get('hostname')
+        self.speed = speed
+        self.strict = strict
+        self.name = '<replay {0}>'.format(path)
+        self.closed = False
+        # (time, event, data) tuples, with the data in the string type of the child
+        self.__events = [(e['t'], e['event'], self.__coerce(e.get('data'))) for e in events]
+        # Next event to read, number of sends passed by the reads, and number of sends replayed
+        self.__position = 0
+        self.__sends_read = 0
+        self.__sends = 0
+        # Indexes of the recorded sends, in order
+        self.__send_indexes = [n for n, e in enumerate(self.__events) if e[1] == 'send']
+        # Data read from the current event but not returned yet (e.g., if size was smaller)
+        self.__remainder = None
+        self.__start = None
+
+    def __coerce(self, text):
+        if text is None or self.encoding is not None:
+            return text
+        return text.encode('latin-1')
+
+    def __wait_for(self, event_time):
+        """Wait until the time of an event, at the speed of the replay."""
+        if self.__start is None:
+            self.__start = monotonic() - event_time / (self.speed or 1.0)
+        if self.speed:
+            delay = self.__start + event_time / self.speed - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Get the next recorded read.
+
+        :param int size: Most bytes or characters to return.
+        :param int timeout: Not used; the recorded timeouts are replayed instead.
+        :return: The output.
+        :rtype: str
+        :raise pexpect.TIMEOUT: If the recorded read timed out, or if the recorded session sent
+            something before the next read, and the replayed session has not sent it yet.
+        :raise pexpect.EOF: If the recorded session ended.
+        """
+        if self.__remainder:
+            data = self.__remainder
+        else:
+            while True:
+                if self.__position >= len(self.__events):
+                    self.flag_eof = True
+                    raise pexpect.EOF('End of the recorded session.')
+                event_time, event, data = self.__events[self.__position]
+                if event != 'send':
+                    break
+                if self.__sends_read >= self.__sends:
+                    # The device's next output is a response to a send that has not happened
+                    raise pexpect.TIMEOUT('Waiting for a send to replay.')
+                self.__position += 1
+                self.__sends_read += 1
+            self.__position += 1
+            self.__wait_for(event_time)
+            if event == 'timeout':
+                raise pexpect.TIMEOUT('Timeout exceeded (recorded).')
+            if event == 'eof':
+                self.flag_eof = True
+                raise pexpect.EOF('End of file (recorded).')
+        data, self.__remainder = data[:size], data[size:]
+        self._log(data, 'read')
+        return data
+
+    def send(self, s):
+        """Replay a send. Nothing is sent anywhere.
+
+        :param str s: The text to send.
+        :return: Number of bytes or characters sent.
+        :rtype: int
+        :raise ReplayMismatch: If strict is True and the text is not the same as the next
+            recorded send.
+        """
+        s = self._coerce_send_string(s)
+        self._log(s, 'send')
+        if self.__sends < len(self.__send_indexes):
+            recorded = self.__events[self.__send_indexes[self.__sends]][2]
+            if self.strict and s != recorded:
+                raise ReplayMismatch('Send {0} was {1!r}, but the recorded send was {2!r}.'.format(
+                    self.__sends + 1, s, recorded))
+        elif self.strict:
+            raise ReplayMismatch('Send {0} ({1!r}) is not in the recording.'.format(
+                self.__sends + 1, s))
+        self.__sends += 1
+        return len(s)
+
+    def sendline(self, s=''):
+        s = self._coerce_send_string(s)
+        return self.send(s + self.linesep)
+
+    def sendcontrol(self, char):
+        char = char.lower()
+        if 'a' <= char <= 'z':
+            return self.send(chr(ord(char) - ord('a') + 1))
+        return self.send(chr(_CONTROL_CHARACTERS.get(char, 0)))
+
+    def write(self, s):
+        self.send(s)
+
+    def writelines(self, sequence):
+        for s in sequence:
+            self.write(s)
+
+    def isalive(self):
+        return not self.closed and self.__position < len(self.__events)
+
+    def terminate(self, force=False):
+        self.close()
+        return True
+
+    def close(self, force=True):
+        self.closed = True
+
+    def fileno(self):
+        # No file descriptor; expect() only needs read_nonblocking()
+        return -1
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
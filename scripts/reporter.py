@@ -1,8 +1,157 @@
 # -*- coding: utf-8 -*-
 """My Reporter class.
+
+Developer notes:
+
+- Each step is timed with a monotonic clock, from step() to the success() or error() that ends
+  it. Steps can nest (e.g., load_configuration uploads the file in its own step); success()
+  and error() end the innermost open step.
+- Step durations are kept in a StepHistogram per step name. By default, the step name is the
+  name of the method that called step() (e.g., run_show), so the histograms show which
+  CiscoIOS methods are slow.
+- If an event sink is set, every step, note, warning, and error is also sent to it as a dict
+  (e.g., to a JsonLinesSink, which writes one JSON object per line).
+- For many devices at once, give each device a Reporter from FleetReporter.device_reporter(),
+  which keeps each device's text separate and shows one aggregated progress line.
 """
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ['Reporter', 'FleetReporter', 'StepHistogram', 'JsonLinesSink', ]
+
+# Monotonic clock for durations; Python 2.7 only has the system clock
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class StepHistogram(object):
+    """Durations of one kind of step, counted in fixed buckets.
+    """
+
+    # Upper bounds of the buckets, in seconds; the last bucket has no upper bound
+    BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0,
+              500.0, 1000.0, )
+
+    def __init__(self):
+        """Class instantiation.
+
+        :return: None
+        :rtype: None
+        """
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.failures = 0
+        # Reporters for several devices may share the histogram
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled (e.g., to return a histogram from a process pool)
+        state = self.__dict__.copy()
+        del state['_StepHistogram__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def add(self, duration, ok=True):
+        """Count a step.
+
+        :param float duration: The step's duration, in seconds.
+        :param bool ok: False if the step failed.
+        :return: None
+        :rtype: None
+        """
+        bucket = 0
+        while bucket < len(self.BOUNDS) and duration > self.BOUNDS[bucket]:
+            bucket += 1
+        with self.__lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += duration
+            self.min = duration if self.min is None else min(self.min, duration)
+            self.max = duration if self.max is None else max(self.max, duration)
+            if not ok:
+                self.failures += 1
+
+    def merge(self, other):
+        """Add the counts of another histogram (e.g., from another device) to this one.
 
-__all__ = ['Reporter', ]
+        :param StepHistogram other: The other histogram.
+        :return: None
+        :rtype: None
+        """
+        if not other.count:
+            return
+        with self.__lock:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+            self.count += other.count
+            self.total += other.total
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+            self.failures += other.failures
+
+    def percentile(self, percent):
+        """Estimate a percentile from the buckets (i.e., the upper bound of the bucket that holds
+        it, capped by the longest duration).
+
+        :param float percent: The percentile (e.g., 90).
+        :return: The duration, in seconds, or None if no steps were counted.
+        :rtype: float
+        """
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if bucket < len(self.BOUNDS):
+                    return min(self.BOUNDS[bucket], self.max)
+                break
+        return self.max
+
+    def summary(self):
+        """Get the step's statistics.
+
+        :rtype: dict
+        """
+        return {'count': self.count,
+                'failures': self.failures,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99), }
+
+
+class JsonLinesSink(object):
+    """Event sink that writes each event to a stream as one line of JSON.
+    """
+
+    def __init__(self, stream):
+        """Class instantiation.
+
+        :param stream: File-like object that receives the events (e.g., an open file).
+        :return: None
+        :rtype: None
+        """
+        self.stream = stream
+        # Reporters for several devices may share the sink
+        self.__lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, sort_keys=True) + '\n'
+        with self.__lock:
+            self.stream.write(line)
+            self.stream.flush()
 
 
 class Reporter(object):
@@ -14,24 +163,261 @@ class Reporter(object):
 
     awaiting_result = False
 
-    def step(self, text):
-        print('Step: {0}'.format(text))
+    def __init__(self, stream=None, device=None, event_sink=None, histograms=None):
+        """Class instantiation.
+
+        :param stream: File-like object that receives the report text (defaults to sys.stdout).
+            Give each device its own stream to keep concurrent workflows from interleaving.
+        :param str device: Name of the device the report is about, added to every event.
+        :param event_sink: Callable that receives each event as a dict (e.g., a JsonLinesSink),
+            or None to not send events.
+        :param dict histograms: StepHistogram by step name, to record step durations in (e.g.,
+            to share one set between devices), or None to start a new set.
+        :return: None
+        :rtype: None
+        """
+        self.stream = stream
+        self.device = device
+        self.event_sink = event_sink
+        self.histograms = {} if histograms is None else histograms
+        # Open steps, innermost last: (name, text, start time)
+        self.__steps = []
+
+    def __emit(self, text):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(text + '\n')
+
+    def __event(self, event, **fields):
+        if self.event_sink is not None:
+            fields.update({'event': event, 'device': self.device, 'time': time.time(), })
+            self.event_sink(fields)
+
+    def __end_step(self, outcome, text=''):
+        if not self.__steps:
+            return
+        name, step_text, start = self.__steps.pop()
+        duration = monotonic() - start
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, StepHistogram())
+        histogram.add(duration, ok=outcome == 'ok')
+        self.__event('step_end', step=name, text=step_text, outcome=outcome,
+                     duration=duration, message=text or None)
+
+    def step(self, text, name=None):
+        """Start a step.
+
+        :param str text: Description of the step.
+        :param str name: Name to time the step under, or None for the name of the calling
+            method.
+        :return: None
+        :rtype: None
+        """
+        if name is None:
+            name = sys._getframe(1).f_code.co_name
+        self.__emit('Step: {0}'.format(text))
         self.awaiting_result = True
+        self.__steps.append((name, text, monotonic()))
+        self.__event('step_start', step=name, text=text)
 
-    @staticmethod
-    def note(text):
-        print('Note: {0}'.format(text))
+    def note(self, text):
+        self.__emit('Note: {0}'.format(text))
+        self.__event('note', text=text)
 
     def warn(self, text):
-        print(self.__YLW + '[WARN]: {0}'.format(text) + self.__CLR)
+        self.__emit(self.__YLW + '[WARN]: {0}'.format(text) + self.__CLR)
+        self.__event('warn', text=text)
 
     def error(self, text=''):
         if text:
-            print(self.__RED + '[FAIL]: {0}'.format(text) + self.__CLR)
+            self.__emit(self.__RED + '[FAIL]: {0}'.format(text) + self.__CLR)
         else:
-            print(self.__RED + '[FAIL]' + self.__CLR)
+            self.__emit(self.__RED + '[FAIL]' + self.__CLR)
         self.awaiting_result = False
+        self.__end_step('fail', text)
 
     def success(self):
-        print(self.__GRN + '[OK]' + self.__CLR)
+        self.__emit(self.__GRN + '[OK]' + self.__CLR)
         self.awaiting_result = False
+        self.__end_step('ok')
+
+    def timings(self):
+        """Get the statistics of each kind of step timed so far.
+
+        :return: StepHistogram.summary() by step name.
+        :rtype: dict
+        """
+        return dict((name, h.summary()) for name, h in self.histograms.items())
+
+
+class FleetReporter(object):
+    """Aggregated live progress for workflows running on many devices at once.
+
+    Give each device its own Reporter from device_reporter(); the reporters send their events
+    to the FleetReporter, which only updates counters under a lock. A background thread
+    redraws one progress line (devices done, in flight, and failed, the rate, and the current
+    step of a few devices) at most once per refresh interval, so hundreds of devices reporting
+    at once never wait on the terminal.
+    """
+
+    def __init__(self, stream=None, refresh_interval=0.5, max_steps_shown=3, event_sink=None):
+        """Class instantiation.
+
+        :param stream: File-like object that receives the progress line (defaults to
+            sys.stdout). On a terminal, the line is redrawn in place; otherwise, each refresh is
+            written on a new line.
+        :param float refresh_interval: Least time between redraws, in seconds.
+        :param int max_steps_shown: Number of in-flight devices to show the current step of.
+        :param event_sink: Callable that also receives every event from the device reporters
+            (e.g., a JsonLinesSink), or None.
+        :return: None
+        :rtype: None
+        :raise ValueError: If an argument is invalid.
+        """
+        if refresh_interval <= 0:
+            raise ValueError('Invalid refresh interval.')
+        self.stream = stream
+        self.refresh_interval = refresh_interval
+        self.max_steps_shown = max_steps_shown
+        self.event_sink = event_sink
+        self.total = None
+        self.done = 0
+        self.failed = 0
+        self.__lock = threading.Lock()
+        # Open step descriptions, innermost last, by hostname of the in-flight devices
+        self.__in_flight = OrderedDict()
+        self.__changed = False
+        self.__start_time = None
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__last_length = 0
+
+    def __call__(self, event):
+        """Count an event from a device reporter. Called by the reporters.
+
+        :param dict event: The event.
+        :return: None
+        :rtype: None
+        """
+        hostname = event.get('device')
+        with self.__lock:
+            steps = self.__in_flight.get(hostname)
+            if steps is not None:
+                if event['event'] == 'step_start':
+                    steps.append(event['text'])
+                    self.__changed = True
+                elif event['event'] == 'step_end' and steps:
+                    steps.pop()
+                    self.__changed = True
+        if self.event_sink is not None:
+            self.event_sink(event)
+
+    def device_reporter(self, hostname, stream=None):
+        """Count a device as in flight, and get a reporter for it.
+
+        :param str hostname: Hostname of the device.
+        :param stream: File-like object that receives the device's report text (e.g., a
+            StringIO). Do not share it between devices.
+        :return: The device's reporter.
+        :rtype: Reporter
+        """
+        with self.__lock:
+            self.__in_flight[hostname] = []
+            self.__changed = True
+        return Reporter(stream=stream, device=hostname, event_sink=self)
+
+    def finish_device(self, hostname, ok=True):
+        """Count a device as done.
+
+        :param str hostname: Hostname of the device.
+        :param bool ok: False if the device's workflow failed.
+        :return: None
+        :rtype: None
+        """
+        with self.__lock:
+            self.__in_flight.pop(hostname, None)
+            self.done += 1
+            if not ok:
+                self.failed += 1
+            self.__changed = True
+
+    def start(self, total=None):
+        """Start drawing the progress line.
+
+        :param int total: Number of devices in the run, if known.
+        :return: None
+        :rtype: None
+        """
+        with self.__lock:
+            self.total = total
+            self.done = 0
+            self.failed = 0
+            self.__in_flight.clear()
+            self.__changed = True
+        self.__start_time = monotonic()
+        self.__last_length = 0
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name='fleet-progress')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """Draw the final progress line, and stop drawing.
+
+        :return: None
+        :rtype: None
+        """
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        self.__draw(final=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __run(self):
+        while not self.__stop.wait(self.refresh_interval):
+            if self.__changed:
+                self.__draw()
+
+    def progress_line(self):
+        """Get the current progress line.
+
+        :rtype: str
+        """
+        with self.__lock:
+            self.__changed = False
+            done, failed, total = self.done, self.failed, self.total
+            in_flight = len(self.__in_flight)
+            current = []
+            for hostname, steps in self.__in_flight.items():
+                if len(current) >= self.max_steps_shown:
+                    break
+                if steps:
+                    current.append('{0}: {1}'.format(hostname, steps[-1]))
+        elapsed = monotonic() - self.__start_time if self.__start_time is not None else 0.0
+        rate = done / elapsed * 60.0 if elapsed else 0.0
+        line = '[{0:.0f}s] {1}{2} done, {3} in flight, {4} failed, {5:.1f} devices/minute'.format(
+            elapsed, done, '/{0}'.format(total) if total is not None else '', in_flight, failed,
+            rate)
+        if current:
+            line += ' | ' + ', '.join(current)
+        return line
+
+    def __draw(self, final=False):
+        stream = self.stream if self.stream is not None else sys.stdout
+        line = self.progress_line()
+        if getattr(stream, 'isatty', lambda: False)():
+            # Redraw in place, blanking what is left of a longer previous line
+            padding = ' ' * max(0, self.__last_length - len(line))
+            self.__last_length = len(line)
+            stream.write('\r' + line + padding + ('\n' if final else ''))
+        else:
+            stream.write(line + '\n')
+        stream.flush()
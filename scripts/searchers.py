@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Precompiled multi-string searchers for pexpect.
+
+Developer notes:
+
+- pexpect.expect_exact() builds a new searcher object for its pattern list on every call, then
+  scans the buffer once per string. A MultiStringSearcher compiles the whole list into one
+  regular expression once, and finds the earliest match in a single pass.
+- Matches follow the same rules as expect_exact(): the earliest match in the buffer wins, and
+  if two strings match at the same place, the one listed first wins.
+- get_searcher() caches searchers by pattern list, so sessions that share a pattern list (e.g.,
+  the SCP prompts, or the prompts of devices with the same hostname) share one searcher.
+- Searchers are safe to share between threads; the match state that pexpect reads after a
+  search is kept per thread.
+- Pass a searcher to child.expect_loop(searcher, timeout) instead of calling expect_exact().
+"""
+import re
+import sys
+import threading
+
+import pexpect
+
+__all__ = ['MultiStringSearcher', 'get_searcher', ]
+
+# Searchers by pattern list
+_searchers = {}
+_searchers_lock = threading.Lock()
+
+
+def _coerce(text, string_type):
+    """Convert text to the string type of a buffer (e.g., str to bytes for byte streams).
+    """
+    if isinstance(text, string_type):
+        return text
+    if isinstance(text, bytes):
+        return text.decode('utf-8')
+    return text.encode('utf-8')
+
+
+class MultiStringSearcher(object):
+    def __init__(self, patterns):
+        """Class instantiation.
+
+        :param list patterns: The strings to look for, plus, optionally, pexpect.EOF and
+            pexpect.TIMEOUT, as for expect_exact().
+        :return: None
+        :rtype: None
+        :raise ValueError: If the list has no strings.
+        """
+        self.eof_index = -1
+        self.timeout_index = -1
+        self.__strings = []
+        # List index of each string, in the order of the alternatives in the expression
+        self.__indexes = []
+        for n, p in enumerate(patterns):
+            if p is pexpect.EOF:
+                self.eof_index = n
+            elif p is pexpect.TIMEOUT:
+                self.timeout_index = n
+            else:
+                self.__strings.append(p)
+                self.__indexes.append(n)
+        if not self.__strings:
+            raise ValueError('No strings to search for.')
+        # pexpect only searches this far back into data it has already searched
+        self.longest_string = max(len(s) for s in self.__strings)
+        # Expressions by buffer string type (e.g., bytes, str)
+        self.__expressions = {}
+        self.__state = threading.local()
+
+    def __expression(self, string_type):
+        expression = self.__expressions.get(string_type)
+        if expression is None:
+            expression = re.compile(_coerce('|', string_type).join(
+                _coerce('(', string_type) + re.escape(_coerce(s, string_type)) +
+                _coerce(')', string_type) for s in self.__strings))
+            self.__expressions[string_type] = expression
+        return expression
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        """Find the earliest string in the buffer. Called by pexpect.
+
+        :param buffer: The text received from the child.
+        :param int freshlen: Length of the text at the end of the buffer that has not been
+            searched yet.
+        :param int searchwindowsize: Only search this much of the end of the buffer, if set.
+        :return: Index of the string in the pattern list, or -1 if no string was found.
+        :rtype: int
+        """
+        # A match can only end in the fresh data
+        offset = max(0, len(buffer) - freshlen - self.longest_string)
+        if searchwindowsize is not None:
+            offset = max(offset, len(buffer) - searchwindowsize)
+        match = self.__expression(type(buffer)).search(buffer, offset)
+        if match is None:
+            return -1
+        self.__state.start, self.__state.end = match.span()
+        self.__state.match = match.group(0)
+        return self.__indexes[match.lastindex - 1]
+
+    @property
+    def start(self):
+        return self.__state.start
+
+    @property
+    def end(self):
+        return self.__state.end
+
+    @property
+    def match(self):
+        return self.__state.match
+
+    def __str__(self):
+        lines = ['MultiStringSearcher:']
+        for n, s in zip(self.__indexes, self.__strings):
+            lines.append('    {0}: {1!r}'.format(n, s))
+        if self.eof_index >= 0:
+            lines.append('    {0}: EOF'.format(self.eof_index))
+        if self.timeout_index >= 0:
+            lines.append('    {0}: TIMEOUT'.format(self.timeout_index))
+        return '\n'.join(lines)
+
+
+def get_searcher(patterns):
+    """Get the searcher for a pattern list, building it the first time it is used.
+
+    :param patterns: A string, or a list of strings (plus, optionally, pexpect.EOF and
+        pexpect.TIMEOUT).
+    :return: The searcher.
+    :rtype: MultiStringSearcher
+    """
+    key = tuple(patterns) if isinstance(patterns, (list, tuple)) else (patterns, )
+    searcher = _searchers.get(key)
+    if searcher is None:
+        with _searchers_lock:
+            searcher = _searchers.get(key)
+            if searcher is None:
+                searcher = MultiStringSearcher(key)
+                _searchers[key] = searcher
+    return searcher
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
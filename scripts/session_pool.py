@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""Reuse authenticated CiscoIOS connections across operations.
+
+Developer notes:
+
+- Sessions are keyed by device, transport, address, and credentials, and are handed out
+  already in Privileged EXEC Mode, so back-to-back jobs against the same device only pay for
+  the connection, login, and startup prompts once.
+- Before handing out an idle session, the pool checks it with a cheap prompt probe (an EOL and
+  a short wait for the Privileged EXEC prompt). Sessions that fail the probe are closed and
+  replaced.
+- Idle sessions are kept alive against the device's exec-timeout (10 minutes by default) by
+  keepalive(); call it periodically or let start_keepalive() do it in the background.
+- Idle sessions are evicted after idle_ttl seconds, and the least recently used idle session
+  is evicted when the pool is full.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import pexpect
+
+from cisco_ios import CiscoIOS, TRANSPORTS
+from reporter import Reporter
+
+__all__ = ['SessionPool', ]
+
+
+class _PooledSession(object):
+    def __init__(self, key, device, child, transport, eol):
+        self.key = key
+        self.device = device
+        self.child = child
+        self.transport = transport
+        self.eol = eol
+        self.last_used = time.time()
+
+
+class SessionPool(object):
+    def __init__(self, max_sessions=64, idle_ttl=300, keepalive_interval=240, probe_timeout=5):
+        """Class instantiation.
+
+        :param int max_sessions: Maximum number of open sessions, idle or in use.
+        :param int idle_ttl: Seconds an unused session stays open before it is evicted.
+        :param int keepalive_interval: Seconds of inactivity before keepalive() nudges a session.
+            Keep this below the device's exec-timeout.
+        :param int probe_timeout: Seconds to wait for a prompt when checking a session's health.
+        :return: None
+        :rtype: None
+        :raise ValueError: If an argument is invalid.
+        """
+        if max_sessions < 1:
+            raise ValueError('Invalid maximum number of sessions.')
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.keepalive_interval = keepalive_interval
+        self.probe_timeout = probe_timeout
+        # Idle sessions, least recently used first
+        self.__idle = OrderedDict()
+        # Sessions handed out, by id(child)
+        self.__in_use = {}
+        # Connections being opened, which already count against max_sessions
+        self.__pending = 0
+        self.__lock = threading.RLock()
+        self.__keepalive_thread = None
+        self.__stop_keepalive = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(hostname, transport, connect_args):
+        """Build the pool key for a device connection.
+
+        :param str hostname: Hostname of the device.
+        :param str transport: 'telnet', 'ssh', or 'serial'.
+        :param dict connect_args: Keyword arguments for the CiscoIOS connect method.
+        :return: The pool key.
+        :rtype: tuple
+        """
+        ignored = ('verbose', 'host_key_check',)
+        return (hostname, transport, ) + tuple(
+            sorted((k, v) for k, v in connect_args.items() if k not in ignored))
+
+    def acquire(self, reporter, eol, hostname, transport, connect_args):
+        """Get a session in Privileged EXEC Mode, reusing an idle one if possible.
+
+        :param labs.cisco.Reporter reporter: A reference to the popup GUI window that reports
+            the status and progress of the script.
+        :param str eol: EOL sequence (LF or CRLF) used by the connection.
+        :param str hostname: Hostname of the device.
+        :param str transport: 'telnet', 'ssh', or 'serial'.
+        :param dict connect_args: Keyword arguments for the CiscoIOS connect method.
+        :return: The device's CiscoIOS instance and the connection in a child application
+            object.
+        :rtype: tuple
+        :raise ValueError: If the transport is invalid.
+        :raise RuntimeError: If the pool is full of sessions in use.
+        """
+        if transport not in TRANSPORTS:
+            raise ValueError('Invalid transport: {0}'.format(transport))
+        key = self.make_key(hostname, transport, connect_args)
+        while True:
+            with self.__lock:
+                session = None
+                for child_id, s in self.__idle.items():
+                    if s.key == key:
+                        session = self.__idle.pop(child_id)
+                        self.__in_use[child_id] = session
+                        break
+            if session is None:
+                break
+            if self.__probe(session):
+                with self.__lock:
+                    self.hits += 1
+                session.last_used = time.time()
+                return session.device, session.child
+            with self.__lock:
+                self.__in_use.pop(id(session.child), None)
+            self.__close(session)
+
+        with self.__lock:
+            if len(self) >= self.max_sessions:
+                if not self.__idle:
+                    raise RuntimeError('Session pool exhausted: all sessions are in use.')
+                # Make room by evicting the least recently used idle session
+                _, evicted = self.__idle.popitem(last=False)
+            else:
+                evicted = None
+            self.__pending += 1
+            self.misses += 1
+        if evicted is not None:
+            self.__close(evicted)
+
+        try:
+            device = CiscoIOS(hostname)
+            child = getattr(device, TRANSPORTS[transport][0])(reporter, eol, **connect_args)
+            session = _PooledSession(key, device, child, transport, eol)
+            with self.__lock:
+                self.__in_use[id(child)] = session
+        finally:
+            with self.__lock:
+                self.__pending -= 1
+        return device, child
+
+    def release(self, child, discard=False):
+        """Return a session to the pool.
+
+        :param pexpect.spawn child: Connection returned by acquire().
+        :param bool discard: True to close the session instead (e.g., after an error that may
+            have left the CLI in an unknown state).
+        :return: None
+        :rtype: None
+        :raise ValueError: If the child did not come from this pool.
+        """
+        with self.__lock:
+            session = self.__in_use.pop(id(child), None)
+            if session is None:
+                raise ValueError('Connection does not belong to this pool.')
+            if not discard and child.isalive():
+                session.last_used = time.time()
+                self.__idle[id(child)] = session
+                return
+        self.__close(session)
+
+    @contextmanager
+    def session(self, reporter, eol, hostname, transport, connect_args):
+        """Context manager around acquire() and release(). Sessions are discarded if the body
+        raises an exception.
+
+        :return: The device's CiscoIOS instance and the connection in a child application
+            object.
+        :rtype: tuple
+        """
+        device, child = self.acquire(reporter, eol, hostname, transport, connect_args)
+        try:
+            yield device, child
+        except Exception:
+            self.release(child, discard=True)
+            raise
+        self.release(child)
+
+    def __probe(self, session):
+        """Check that a session is still alive and sitting at a Privileged EXEC prompt.
+
+        :param _PooledSession session: The session to check.
+        :return: True if the session is usable.
+        :rtype: bool
+        """
+        child = session.child
+        if not child.isalive():
+            return False
+        try:
+            child.sendline(session.eol)
+            # noinspection PyTypeChecker
+            index = child.expect_exact(
+                session.device.device_prompts + [pexpect.TIMEOUT, pexpect.EOF, ],
+                timeout=self.probe_timeout)
+        except pexpect.ExceptionPexpect:
+            return False
+        return index == 1
+
+    def keepalive(self):
+        """Nudge idle sessions that are close to the device's exec-timeout, and evict idle
+        sessions past their time-to-live.
+
+        :return: None
+        :rtype: None
+        """
+        now = time.time()
+        expired = []
+        due = []
+        with self.__lock:
+            for child_id, s in list(self.__idle.items()):
+                if now - s.last_used >= self.idle_ttl:
+                    expired.append(self.__idle.pop(child_id))
+                elif now - s.last_used >= self.keepalive_interval:
+                    # Take the session out of the pool while probing it
+                    due.append(self.__idle.pop(child_id))
+        for s in expired:
+            self.__close(s)
+        for s in due:
+            if self.__probe(s):
+                # Keep the idle clock running, so the TTL still applies
+                with self.__lock:
+                    self.__idle[id(s.child)] = s
+            else:
+                self.__close(s)
+
+    def start_keepalive(self, period=30):
+        """Run keepalive() in a background thread.
+
+        :param int period: Seconds between runs.
+        :return: None
+        :rtype: None
+        """
+        if self.__keepalive_thread is not None:
+            return
+        self.__stop_keepalive.clear()
+
+        def run():
+            while not self.__stop_keepalive.wait(period):
+                self.keepalive()
+
+        self.__keepalive_thread = threading.Thread(target=run, name='session-pool-keepalive')
+        self.__keepalive_thread.daemon = True
+        self.__keepalive_thread.start()
+
+    def stop_keepalive(self):
+        if self.__keepalive_thread is not None:
+            self.__stop_keepalive.set()
+            self.__keepalive_thread.join()
+            self.__keepalive_thread = None
+
+    def close_all(self):
+        """Close every idle session and stop the keepalive thread. Sessions in use are closed
+        when released.
+
+        :return: None
+        :rtype: None
+        """
+        self.stop_keepalive()
+        with self.__lock:
+            sessions = list(self.__idle.values())
+            self.__idle.clear()
+        for s in sessions:
+            self.__close(s)
+
+    @staticmethod
+    def __close(session):
+        try:
+            # Discard status messages from background work, such as evictions
+            reporter = Reporter(stream=StringIO())
+            getattr(CiscoIOS, TRANSPORTS[session.transport][1])(session.child, reporter)
+        except Exception:
+            # The connection may already be dead; make sure the child process is gone
+            session.child.close(force=True)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__idle) + len(self.__in_use) + self.__pending
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
@@ -0,0 +1,588 @@
+# -*- coding: utf-8 -*-
+"""In-process TFTP server for device transfers, using asyncio.
+
+Developer notes:
+
+- Requires Python 3.5+, like cisco_ios_async.py.
+- Serves read (device downloads the file; e.g., upload_to_device_tftp) and write (device sends
+  the file; e.g., download_from_device_tftp) requests from a directory, with no system TFTP
+  service, firewall changes, or placeholder files.
+- Supports the TFTP options for block size (RFC 2348), transfer size (RFC 2349), timeout
+  (RFC 2349), and window size (RFC 7440), negotiated through RFC 2347 option acknowledgments.
+  With larger blocks (e.g., ip tftp blocksize 8192) and windows, a transfer no longer waits
+  for a round trip every 512 bytes. The device only asks for larger blocks if ip tftp blocksize
+  is set; pass blksize to the CiscoIOS TFTP methods to set it for the transfer.
+- One UDP socket serves every device: packets are routed to each device's transfer by the
+  device's address and port. Each transfer holds one open file and one block in memory, so
+  memory does not grow with file size.
+- Mode is always binary (octet); netascii requests are served as-is.
+- Port 69 is a privileged port. Run as a user allowed to bind it (e.g., with the
+  CAP_NET_BIND_SERVICE capability), or redirect port 69 to the server's port.
+- Run the server on a thread of its own with start() and stop(), or on an existing event loop
+  with open() and close():
+
+    with TftpServer('/srv/images') as server:
+        device.upload_to_device_tftp(child, reporter, eol, 'flash', '192.168.1.10',
+                                     'c3745-adventerprisek9-mz.124-25d.bin',
+                                     'c3745-adventerprisek9-mz.124-25d.bin',
+                                     tftp_server=server, blksize=8192)
+"""
+import asyncio
+import collections
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+__all__ = ['TftpServer', 'TftpError', ]
+
+# Opcodes (RFC 1350 and RFC 2347)
+RRQ = 1
+WRQ = 2
+DATA = 3
+ACK = 4
+ERROR = 5
+OACK = 6
+
+# Error codes (RFC 1350 and RFC 2347)
+NOT_DEFINED = 0
+FILE_NOT_FOUND = 1
+ACCESS_VIOLATION = 2
+DISK_FULL = 3
+ILLEGAL_OPERATION = 4
+UNKNOWN_TRANSFER_ID = 5
+FILE_EXISTS = 6
+
+DEFAULT_BLKSIZE = 512
+MIN_BLKSIZE = 8
+MAX_BLKSIZE = 65464
+MAX_WINDOWSIZE = 65535
+
+
+class TftpError(Exception):
+    """A TFTP error, sent to the client as an ERROR packet.
+    """
+
+    def __init__(self, code, message):
+        super(TftpError, self).__init__(message)
+        self.code = code
+
+
+def _error_packet(code, message):
+    return struct.pack('!HH', ERROR, code) + message.encode('ascii', 'replace') + b'\0'
+
+
+class _Transfer(object):
+    """One client's transfer. Block numbers are counted from 1 without wrapping; only the
+    numbers in packets wrap at 65536.
+    """
+    direction = None
+
+    def __init__(self, server, peer, filename, path, options):
+        self.server = server
+        self.peer = peer
+        self.filename = filename
+        self.path = path
+        self.blksize = DEFAULT_BLKSIZE
+        self.windowsize = 1
+        self.timeout = server.timeout
+        self.tsize = None
+        self.retries = 0
+        self.bytes = 0
+        self.done = False
+        self.started = time.monotonic()
+        self.__timer = None
+        self.oack = self.negotiate(options)
+
+    def negotiate(self, options):
+        """Accept the options the server supports, within the server's limits.
+
+        :param dict options: Requested options, by lowercase name.
+        :return: Accepted options and values, for the OACK, or None if none were accepted.
+        :rtype: dict
+        """
+        accepted = collections.OrderedDict()
+        for name, value in options.items():
+            try:
+                value = int(value)
+            except ValueError:
+                continue
+            if name == 'blksize' and value >= MIN_BLKSIZE:
+                self.blksize = min(value, MAX_BLKSIZE, self.server.max_blksize)
+                accepted[name] = self.blksize
+            elif name == 'windowsize' and 1 <= value <= MAX_WINDOWSIZE:
+                self.windowsize = min(value, self.server.max_windowsize)
+                accepted[name] = self.windowsize
+            elif name == 'timeout' and 1 <= value <= 255:
+                self.timeout = value
+                accepted[name] = value
+            elif name == 'tsize' and value >= 0:
+                accepted[name] = self.tsize = self.transfer_size(value)
+        return accepted or None
+
+    def transfer_size(self, requested):
+        return requested
+
+    def send(self, packet):
+        self.server.sendto(packet, self.peer)
+
+    def send_oack(self):
+        packet = struct.pack('!H', OACK)
+        for name, value in self.oack.items():
+            packet += name.encode('ascii') + b'\0' + str(value).encode('ascii') + b'\0'
+        self.send(packet)
+
+    def arm(self):
+        """Restart the retransmission timer."""
+        if self.__timer is not None:
+            self.__timer.cancel()
+        self.__timer = self.server.loop.call_later(self.timeout, self.__on_timeout)
+
+    def __on_timeout(self):
+        self.__timer = None
+        if self.done:
+            self.server.remove(self)
+            return
+        self.retries += 1
+        if self.retries > self.server.retries:
+            self.abort(NOT_DEFINED, 'Timed out.')
+            return
+        self.retransmit()
+        self.arm()
+
+    def abort(self, code, message, notify=True):
+        if notify:
+            self.send(_error_packet(code, message))
+        self.finish(False, message)
+
+    def finish(self, ok, error=None, linger=False):
+        """End the transfer, and record it.
+
+        :param bool ok: True if the transfer completed.
+        :param str error: Reason the transfer failed, if it did.
+        :param bool linger: True to keep answering the client for one more timeout (e.g., to
+            acknowledge the last block again, if the client did not get the acknowledgment).
+        """
+        if self.done:
+            return
+        self.done = True
+        self.close(ok)
+        self.server.record({'peer': '{0}:{1}'.format(*self.peer[:2]),
+                            'filename': self.filename,
+                            'direction': self.direction,
+                            'ok': ok,
+                            'error': error,
+                            'bytes': self.bytes,
+                            'seconds': time.monotonic() - self.started,
+                            'blksize': self.blksize,
+                            'windowsize': self.windowsize, })
+        if linger:
+            self.arm()
+        else:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            self.server.remove(self)
+
+    def close(self, ok):
+        pass
+
+    def start(self):
+        raise NotImplementedError
+
+    def handle(self, opcode, payload):
+        raise NotImplementedError
+
+    def retransmit(self):
+        raise NotImplementedError
+
+
+class _ReadTransfer(_Transfer):
+    """Sends a file to the client."""
+    direction = 'read'
+
+    def __init__(self, server, peer, filename, path, options):
+        try:
+            self.file = open(path, 'rb')
+        except (IOError, OSError):
+            raise TftpError(FILE_NOT_FOUND, 'File not found.')
+        self.size = os.fstat(self.file.fileno()).st_size
+        super(_ReadTransfer, self).__init__(server, peer, filename, path, options)
+        # The last block is shorter than blksize (empty, if the size is a multiple of blksize)
+        self.last_block = self.size // self.blksize + 1
+        self.acked = 0
+        self.sent = 0
+        self.waiting_for_oack_ack = self.oack is not None
+
+    def transfer_size(self, requested):
+        return self.size
+
+    def start(self):
+        if self.waiting_for_oack_ack:
+            self.send_oack()
+        else:
+            self.send_window()
+        self.arm()
+
+    def send_window(self):
+        last = min(self.acked + self.windowsize, self.last_block)
+        for block in range(self.acked + 1, last + 1):
+            self.file.seek((block - 1) * self.blksize)
+            data = self.file.read(self.blksize)
+            self.send(struct.pack('!HH', DATA, block & 0xFFFF) + data)
+        self.sent = last
+
+    def retransmit(self):
+        if self.waiting_for_oack_ack:
+            self.send_oack()
+        else:
+            self.send_window()
+
+    def handle(self, opcode, payload):
+        if opcode != ACK or len(payload) < 2:
+            raise TftpError(ILLEGAL_OPERATION, 'Expected an ACK.')
+        block = struct.unpack('!H', payload[:2])[0]
+        if self.waiting_for_oack_ack:
+            if block == 0:
+                self.waiting_for_oack_ack = False
+                self.retries = 0
+                self.send_window()
+                self.arm()
+            return
+        # Blocks acknowledged by this ACK, counting from the last acknowledged block
+        delta = (block - self.acked) & 0xFFFF
+        if 0 < delta <= self.sent - self.acked:
+            self.bytes = min(self.size, (self.acked + delta) * self.blksize)
+            self.acked += delta
+            self.retries = 0
+            if self.acked == self.last_block:
+                self.finish(True)
+                return
+            self.send_window()
+            self.arm()
+        # Otherwise, a duplicate ACK; ignore it, and let the timer resend the window, so
+        # duplicates do not double the traffic (the Sorcerer's Apprentice bug)
+
+    def close(self, ok):
+        self.file.close()
+
+
+class _WriteTransfer(_Transfer):
+    """Receives a file from the client."""
+    direction = 'write'
+
+    def __init__(self, server, peer, filename, path, options):
+        if not server.allow_write:
+            raise TftpError(ACCESS_VIOLATION, 'Writes are not allowed.')
+        if os.path.exists(path) and not server.allow_overwrite:
+            raise TftpError(FILE_EXISTS, 'File already exists.')
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            raise TftpError(ACCESS_VIOLATION, 'Directory not found.')
+        # Write to a temporary file, and replace the destination when the transfer completes
+        fd, self.temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.',
+                                              suffix='.part', dir=directory)
+        self.file = os.fdopen(fd, 'wb')
+        super(_WriteTransfer, self).__init__(server, peer, filename, path, options)
+        self.received = 0
+        self.last_ack = 0
+
+    def start(self):
+        self.retransmit()
+        self.arm()
+
+    def send_ack(self):
+        self.send(struct.pack('!HH', ACK, self.received & 0xFFFF))
+        self.last_ack = self.received
+
+    def retransmit(self):
+        if self.received == 0 and self.oack is not None:
+            self.send_oack()
+        else:
+            self.send_ack()
+
+    def handle(self, opcode, payload):
+        if opcode != DATA or len(payload) < 2:
+            raise TftpError(ILLEGAL_OPERATION, 'Expected DATA.')
+        if self.done:
+            # The client did not get the last ACK
+            self.send_ack()
+            return
+        block = struct.unpack('!H', payload[:2])[0]
+        data = payload[2:]
+        if (block - self.received) & 0xFFFF != 1:
+            # A duplicate, or a block after a lost one; acknowledge the blocks received in order,
+            # so the client resends from there
+            self.send_ack()
+            self.arm()
+            return
+        if len(data) > self.blksize:
+            raise TftpError(ILLEGAL_OPERATION, 'Block is larger than the block size.')
+        try:
+            self.file.write(data)
+        except (IOError, OSError):
+            raise TftpError(DISK_FULL, 'Unable to write the file.')
+        self.received += 1
+        self.bytes += len(data)
+        self.retries = 0
+        if len(data) < self.blksize:
+            self.send_ack()
+            self.finish(True, linger=True)
+            return
+        if self.received - self.last_ack >= self.windowsize:
+            self.send_ack()
+        self.arm()
+
+    def close(self, ok):
+        self.file.close()
+        if ok:
+            os.rename(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+
+class _TftpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        # e.g., ICMP port unreachable from a client that went away; the timers clean up
+        pass
+
+
+class TftpServer(object):
+    def __init__(self, root,
+                 host='0.0.0.0',
+                 port=69,
+                 timeout=5,
+                 retries=5,
+                 max_blksize=MAX_BLKSIZE,
+                 max_windowsize=64,
+                 allow_write=True,
+                 allow_overwrite=True,
+                 max_transfers=1024,
+                 socket_buffer_size=4 * 1024 * 1024):
+        """Class instantiation.
+
+        :param str root: Directory to serve files from and write files to.
+        :param str host: Address to listen on.
+        :param int port: Port to listen on, or 0 for any free port.
+        :param int timeout: Default seconds to wait for the client before sending again.
+        :param int retries: Times to send again before giving up on a client.
+        :param int max_blksize: Largest block size to accept.
+        :param int max_windowsize: Largest window size to accept.
+        :param bool allow_write: True to accept write requests.
+        :param bool allow_overwrite: True to replace existing files on write requests.
+        :param int max_transfers: Most transfers at the same time.
+        :param int socket_buffer_size: Size to request for the socket's send and receive
+            buffers, so windows from many devices are not dropped, or None for the default.
+        :return: None
+        :rtype: None
+        :raise ValueError: If the root directory does not exist.
+        """
+        if not os.path.isdir(root):
+            raise ValueError('Invalid TFTP root directory: {0}.'.format(root))
+        self.root = os.path.realpath(root)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.max_blksize = max_blksize
+        self.max_windowsize = max_windowsize
+        self.allow_write = allow_write
+        self.allow_overwrite = allow_overwrite
+        self.max_transfers = max_transfers
+        self.socket_buffer_size = socket_buffer_size
+        self.loop = None
+        # Completed and failed transfers, most recent last
+        self.transfers = collections.deque(maxlen=1000)
+        self.__transport = None
+        self.__active = {}
+        self.__thread = None
+
+    @property
+    def active(self):
+        """Number of transfers in progress."""
+        return sum(1 for t in self.__active.values() if not t.done)
+
+    def relative_path(self, path):
+        """Get the path of a file relative to the root (e.g., for the device's copy command).
+
+        :param str path: Path of the file, absolute (under the root) or relative to the root.
+        :return: The path relative to the root, with forward slashes.
+        :rtype: str
+        :raise ValueError: If the path is outside the root.
+        """
+        local_path = os.path.realpath(path) if os.path.isabs(path) else None
+        if local_path is None or not local_path.startswith(self.root + os.sep):
+            local_path = os.path.realpath(os.path.join(self.root, path.lstrip('/')))
+        if not local_path.startswith(self.root + os.sep):
+            raise ValueError('{0} is outside the TFTP root directory.'.format(path))
+        return os.path.relpath(local_path, self.root).replace(os.sep, '/')
+
+    def local_path(self, filename):
+        """Get the local path of a requested file.
+
+        :param str filename: The filename in the request, relative to the root.
+        :return: The path.
+        :rtype: str
+        :raise TftpError: If the file is outside the root.
+        """
+        local_path = os.path.realpath(os.path.join(self.root, filename.lstrip('/')))
+        if not local_path.startswith(self.root + os.sep):
+            raise TftpError(ACCESS_VIOLATION, 'Access violation.')
+        return local_path
+
+    async def open(self, loop=None):
+        """Listen for requests on an event loop.
+
+        :param loop: The event loop, or None for the current loop.
+        :return: The port the server listens on.
+        :rtype: int
+        """
+        self.loop = loop or asyncio.get_event_loop()
+        self.__transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: _TftpProtocol(self), local_addr=(self.host, self.port))
+        self.port = self.__transport.get_extra_info('sockname')[1]
+        if self.socket_buffer_size:
+            sock = self.__transport.get_extra_info('socket')
+            for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, option, self.socket_buffer_size)
+                except (OSError, ValueError):
+                    # The system limit (e.g., net.core.rmem_max) applies instead
+                    pass
+        return self.port
+
+    def close(self):
+        """Stop listening, and abandon any transfers in progress.
+
+        :return: None
+        :rtype: None
+        """
+        for transfer in list(self.__active.values()):
+            transfer.abort(NOT_DEFINED, 'Server stopped.', notify=not transfer.done)
+        self.__active.clear()
+        if self.__transport is not None:
+            self.__transport.close()
+            self.__transport = None
+
+    def start(self):
+        """Run the server on a thread of its own.
+
+        :return: The port the server listens on.
+        :rtype: int
+        :raise OSError: If unable to listen on the port.
+        """
+        started = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(self.open(loop))
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                loop.close()
+                return
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                self.close()
+                loop.close()
+
+        self.__thread = threading.Thread(target=run, name='tftp-server')
+        self.__thread.daemon = True
+        self.__thread.start()
+        started.wait()
+        if errors:
+            self.__thread = None
+            raise errors[0]
+        return self.port
+
+    def stop(self):
+        """Stop the server started with start().
+
+        :return: None
+        :rtype: None
+        """
+        if self.__thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.__thread.join()
+            self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def sendto(self, packet, peer):
+        if self.__transport is not None:
+            self.__transport.sendto(packet, peer)
+
+    def record(self, result):
+        self.transfers.append(result)
+
+    def remove(self, transfer):
+        if self.__active.get(transfer.peer) is transfer:
+            del self.__active[transfer.peer]
+
+    def datagram_received(self, data, peer):
+        if len(data) < 2:
+            return
+        opcode = struct.unpack('!H', data[:2])[0]
+        payload = data[2:]
+        transfer = self.__active.get(peer)
+        try:
+            if opcode in (RRQ, WRQ):
+                if transfer is not None:
+                    # The client started over
+                    transfer.finish(False, 'Replaced by a new request.')
+                self.__start_transfer(opcode, payload, peer)
+            elif transfer is None:
+                if opcode != ERROR:
+                    self.sendto(_error_packet(UNKNOWN_TRANSFER_ID, 'Unknown transfer ID.'), peer)
+            elif opcode == ERROR:
+                transfer.finish(False, 'Client error: {0}'.format(
+                    payload[2:].rstrip(b'\0').decode('ascii', 'replace')))
+            else:
+                transfer.handle(opcode, payload)
+        except TftpError as e:
+            if transfer is not None and self.__active.get(peer) is transfer:
+                transfer.abort(e.code, str(e))
+            else:
+                self.sendto(_error_packet(e.code, str(e)), peer)
+
+    def __start_transfer(self, opcode, payload, peer):
+        fields = payload.split(b'\0')
+        if len(fields) < 3:
+            raise TftpError(ILLEGAL_OPERATION, 'Malformed request.')
+        filename = fields[0].decode('ascii', 'replace')
+        # Options are name and value pairs after the filename and mode
+        options = collections.OrderedDict()
+        for n in range(2, len(fields) - 1, 2):
+            options[fields[n].decode('ascii', 'replace').lower()] = \
+                fields[n + 1].decode('ascii', 'replace')
+        if self.active >= self.max_transfers:
+            raise TftpError(NOT_DEFINED, 'Too many transfers; try again later.')
+        path = self.local_path(filename)
+        transfer_class = _ReadTransfer if opcode == RRQ else _WriteTransfer
+        transfer = transfer_class(self, peer, filename, path, options)
+        self.__active[peer] = transfer
+        transfer.start()
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Session transcripts: buffered, rotating, and optionally compressed.
+
+Developer notes:
+
+- pexpect writes everything it sends and receives to child.logfile, and flushes it after every
+  write. With a plain file, each flush is a system call on the expect loop's thread.
+- A TranscriptWriter only queues the data in write() and ignores flush(); a background thread
+  writes the queued data through a large buffer, so disk I/O never blocks the session.
+- Transcripts rotate to a new part when the current part reaches max_bytes of session data,
+  and the oldest parts are deleted when there are more than max_parts.
+- Parts can be compressed with gzip (standard library) or Zstandard (requires the zstandard
+  package).
+- Transcript names include the hostname, the UTC start time, the process ID, and a counter, so
+  sessions that start in the same second never share a file.
+- Call close() when the session ends, to write the remaining data and close the file.
+"""
+import gzip
+import itertools
+import os
+import sys
+import threading
+from datetime import datetime
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ['TranscriptWriter', 'COMPRESSIONS', ]
+
+# File name extensions, by compression
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst', }
+
+# Counter for unique transcript names within the process
+_session_counter = itertools.count(1)
+_session_counter_lock = threading.Lock()
+
+
+class TranscriptWriter(object):
+    def __init__(self, hostname,
+                 directory='.',
+                 max_bytes=64 * 1024 * 1024,
+                 max_parts=None,
+                 compression=None,
+                 buffer_size=1024 * 1024):
+        """Class instantiation. Creates the first part of the transcript, and starts the writer
+        thread.
+
+        :param str hostname: Hostname of the device, used in the transcript's name.
+        :param str directory: Directory for the transcript's parts.
+        :param int max_bytes: Session data, in bytes, to write to a part before rotating to a
+            new part, or None to never rotate.
+        :param int max_parts: Most parts to keep, deleting the oldest, or None to keep them all.
+        :param str compression: None, 'gzip', or 'zstd'.
+        :param int buffer_size: Size of the file buffer, in bytes.
+        :return: None
+        :rtype: None
+        :raise ValueError: If an argument is invalid.
+        :raise RuntimeError: If Zstandard compression is requested, but the zstandard package is
+            not installed.
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError('Invalid compression: {0}.'.format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise RuntimeError('Zstandard compression requires the zstandard package.')
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError('Invalid maximum part size.')
+        if max_parts is not None and max_parts < 1:
+            raise ValueError('Invalid maximum number of parts.')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_parts = max_parts
+        self.compression = compression
+        self.buffer_size = buffer_size
+        with _session_counter_lock:
+            session_num = next(_session_counter)
+        self.name = '{0}-{1}-{2}-{3}'.format(
+            hostname, datetime.utcnow().strftime('%y%m%d-%H%M%SZ'), os.getpid(), session_num)
+        # Paths of the parts kept, oldest first
+        self.paths = []
+        self.parts = 0
+        self.bytes_written = 0
+        self.closed = False
+        self.__part_bytes = 0
+        self.__file = None
+        self.__raw_file = None
+        self.__error = None
+        self.__queue = queue.Queue()
+        self.__open_part()
+        self.__thread = threading.Thread(target=self.__run, name='transcript-' + self.name)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def write(self, data):
+        """Queue data for the transcript. Called by pexpect.
+
+        :param data: Bytes, or text, which is written as UTF-8.
+        :return: None
+        :rtype: None
+        :raise ValueError: If the transcript is closed.
+        """
+        if self.closed:
+            raise ValueError('Write to a closed transcript.')
+        if data:
+            self.__queue.put(data)
+
+    def flush(self):
+        """Do nothing. Called by pexpect after every write; the writer thread writes the data
+        as soon as it can.
+        """
+        pass
+
+    def close(self):
+        """Write the queued data, close the file, and stop the writer thread.
+
+        :return: None
+        :rtype: None
+        :raise IOError: If the writer thread could not write to the transcript.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.__queue.put(None)
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __run(self):
+        """Write queued data until close() is called. Writes everything that is queued at once,
+        so a busy session produces a few large writes instead of many small ones.
+        """
+        done = False
+        while not done:
+            chunks = [self.__queue.get()]
+            while True:
+                try:
+                    chunks.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            if chunks[-1] is None:
+                chunks.pop()
+                done = True
+            if self.__error is not None:
+                # Keep draining the queue, so the session is not affected
+                continue
+            try:
+                for chunk in chunks:
+                    self.__write_part(chunk)
+                if done:
+                    self.__close_part()
+            except (IOError, OSError) as ex:
+                self.__error = ex
+
+    def __write_part(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        while data:
+            if self.max_bytes is not None and self.__part_bytes >= self.max_bytes:
+                self.__close_part()
+                self.__open_part()
+            size = len(data)
+            if self.max_bytes is not None:
+                size = min(size, self.max_bytes - self.__part_bytes)
+            self.__file.write(data[:size])
+            data = data[size:]
+            self.__part_bytes += size
+            self.bytes_written += size
+
+    def __open_part(self):
+        # The first part has no number; later parts are numbered (e.g., R1-...-1.002.gz)
+        self.parts += 1
+        part_name = self.name
+        if self.parts > 1:
+            part_name += '.{0:03d}'.format(self.parts)
+        path = os.path.join(self.directory, part_name + COMPRESSIONS[self.compression])
+        self.__raw_file = open(path, 'wb', self.buffer_size)
+        if self.compression == 'gzip':
+            self.__file = gzip.GzipFile(filename='', mode='wb', fileobj=self.__raw_file)
+        elif self.compression == 'zstd':
+            self.__file = zstandard.ZstdCompressor().stream_writer(self.__raw_file)
+        else:
+            self.__file = self.__raw_file
+        self.paths.append(path)
+        self.__part_bytes = 0
+        if self.max_parts is not None:
+            while len(self.paths) > self.max_parts:
+                os.remove(self.paths.pop(0))
+
+    def __close_part(self):
+        if self.__file is not self.__raw_file:
+            self.__file.close()
+        if not self.__raw_file.closed:
+            self.__raw_file.close()
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Results and throughput metrics of file transfers.
+
+Developer notes:
+
+- IOS ends every copy with a summary line, such as
+  '14606129 bytes copied in 166.925 secs (87501 bytes/sec)'. parse_copy_output() gets the byte
+  count, the seconds, and the rate from that line.
+- The CiscoIOS transfer methods (SCP, FTP, TFTP, and HTTP) return a TransferResult, keep it in
+  the instance's transfers list, and send it to the instance's transfer sink, if any (e.g., a
+  TransferMetrics shared by every device).
+- The seconds and the rate are the device's own measurements of the transfer. elapsed is the
+  time the host spent on the whole copy command, including the copy dialog and any retries.
+- Uploads skipped because the device already has the file (skip_if_identical) are recorded
+  too, with skipped set to True and no bytes, so they do not count towards the throughput.
+  verified is True or False if the upload was checked against the device's digest afterwards.
+- TransferMetrics.summary() aggregates the transfers by protocol, and lists the slowest
+  transfers, to compare protocols and spot slow links. FleetRunner.transfer_throughput() does
+  the same for the transfers of the last fleet run.
+"""
+import re
+import sys
+import threading
+
+__all__ = ['TransferResult', 'TransferMetrics', 'parse_copy_output', ]
+
+# Reference: 14606129 bytes copied in 166.925 secs (87501 bytes/sec)
+_COPY_SUMMARY = re.compile(
+    r'(\d+) bytes copied in ([\d.]+) secs(?:\s*\((\d+) bytes/sec\))?')
+
+
+def parse_copy_output(output):
+    """Get the byte count, the seconds, and the rate from the output of a copy command.
+
+    :param str output: The output, including the 'bytes copied in' line.
+    :return: (bytes, seconds, bytes per second), or None if the output has no summary line.
+        If IOS does not report the rate, it is calculated from the bytes and the seconds.
+    :rtype: tuple
+    """
+    match = _COPY_SUMMARY.search(output)
+    if match is None:
+        return None
+    byte_count = int(match.group(1))
+    seconds = float(match.group(2))
+    if match.group(3) is not None:
+        rate = int(match.group(3))
+    else:
+        rate = int(byte_count / seconds) if seconds else None
+    return byte_count, seconds, rate
+
+
+class TransferResult(object):
+    """The outcome of one file transfer.
+    """
+
+    def __init__(self, protocol, direction, device, filename, output, elapsed=None,
+                 retries=0, skipped=False):
+        """Class instantiation.
+
+        :param str protocol: Transfer protocol (e.g., 'scp', 'ftp', 'tftp', or 'http').
+        :param str direction: 'upload' (to the device) or 'download' (from the device).
+        :param str device: Hostname of the device.
+        :param str filename: Name of the file transferred.
+        :param str output: The output of the copy command, including the 'bytes copied in'
+            line. If the line cannot be parsed, bytes, seconds, and rate are None.
+        :param float elapsed: Seconds the host spent on the copy command, or None.
+        :param int retries: Number of failed attempts before the transfer succeeded.
+        :param bool skipped: True if the transfer was skipped, because the device already had
+            the file.
+        :return: None
+        :rtype: None
+        """
+        self.protocol = protocol
+        self.direction = direction
+        self.device = device
+        self.filename = filename
+        self.elapsed = elapsed
+        self.retries = retries
+        self.skipped = skipped
+        # True or False once the transferred file is checked against the device's digest
+        self.verified = None
+        self.bytes, self.seconds, self.rate = parse_copy_output(output) or (None, None, None)
+
+    def as_dict(self):
+        """Get the result as a dict (e.g., for reporter.JsonLinesSink).
+
+        :rtype: dict
+        """
+        return {'protocol': self.protocol,
+                'direction': self.direction,
+                'device': self.device,
+                'filename': self.filename,
+                'bytes': self.bytes,
+                'seconds': self.seconds,
+                'rate': self.rate,
+                'elapsed': self.elapsed,
+                'retries': self.retries,
+                'skipped': self.skipped,
+                'verified': self.verified, }
+
+    def __repr__(self):
+        if self.skipped:
+            return '<TransferResult {0} {1} {2} {3}: skipped>'.format(
+                self.protocol, self.direction, self.device, self.filename)
+        return '<TransferResult {0} {1} {2} {3}: {4} bytes at {5} bytes/sec>'.format(
+            self.protocol, self.direction, self.device, self.filename, self.bytes, self.rate)
+
+
+class TransferMetrics(object):
+    """Transfer sink that aggregates transfer results by protocol.
+    """
+
+    def __init__(self, slowest=5):
+        """Class instantiation.
+
+        :param int slowest: Number of slowest transfers to list for each protocol.
+        :return: None
+        :rtype: None
+        """
+        self.slowest = slowest
+        # TransferResults by protocol, in order of arrival
+        self.results = {}
+        # Devices of several threads may share the sink
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled (e.g., to return the metrics from a process pool)
+        state = self.__dict__.copy()
+        del state['_TransferMetrics__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __call__(self, result):
+        with self.__lock:
+            self.results.setdefault(result.protocol, []).append(result)
+
+    def merge(self, other):
+        """Add the results of another TransferMetrics (e.g., from another process).
+
+        :param TransferMetrics other: The other metrics.
+        :return: None
+        :rtype: None
+        """
+        with self.__lock:
+            for protocol, results in other.results.items():
+                self.results.setdefault(protocol, []).extend(results)
+
+    def summary(self):
+        """Get the statistics of each protocol. Throughput is the total bytes over the total
+        seconds, as measured by the devices; transfers whose output could not be parsed are
+        counted, but not measured. Skipped transfers are only counted as skipped.
+
+        :return: Statistics by protocol.
+        :rtype: dict
+        """
+        with self.__lock:
+            results = dict((p, list(r)) for p, r in self.results.items())
+        summary = {}
+        for protocol, transfers in results.items():
+            skipped = [r for r in transfers if r.skipped]
+            transfers = [r for r in transfers if not r.skipped]
+            measured = [r for r in transfers if r.bytes is not None]
+            total_bytes = sum(r.bytes for r in measured)
+            total_seconds = sum(r.seconds for r in measured)
+            rates = sorted(r.rate for r in measured if r.rate is not None)
+            slowest = sorted([r for r in measured if r.rate is not None],
+                             key=lambda r: r.rate)[:self.slowest]
+            summary[protocol] = {
+                'transfers': len(transfers),
+                'unmeasured': len(transfers) - len(measured),
+                'skipped': len(skipped),
+                'verify_failures': len([r for r in transfers if r.verified is False]),
+                'retries': sum(r.retries for r in transfers),
+                'bytes': total_bytes,
+                'seconds': total_seconds,
+                'throughput': total_bytes / total_seconds if total_seconds else None,
+                'min_rate': rates[0] if rates else None,
+                'median_rate': rates[len(rates) // 2] if rates else None,
+                'max_rate': rates[-1] if rates else None,
+                'slowest': [(r.device, r.filename, r.rate) for r in slowest], }
+        return summary
+
+
+if __name__ == '__main__':
+    raise RuntimeError(
+        'Script {0} cannot be run independently of the application.'.format(sys.argv[0]))
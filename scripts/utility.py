@@ -28,7 +28,8 @@ __all__ = ('run_cli_command',
            'validate_password',
            'fix_tftp_filepath',
            'enable_ftp',
-           'disable_ftp',)
+           'disable_ftp',
+           'get_file_hash',)
 
 import pexpect
 
@@ -465,27 +466,41 @@ def disable_ntp(sudo_password=None):
         run_cli_command(c, sudo_password)
 
 
-def get_file_hash(filepaths):
-    """Hash a file.
+def get_file_hash(filepaths, algorithms=None, block_size=1024 * 1024):
+    """Hash a file. The file is read in blocks, so large files (e.g., IOS images) are not read
+    into memory at once, and each block is passed to every algorithm.
 
     :param list filepaths: The files to be hashed.
-    :return: A dictionary of hashes for the file.
+    :param list algorithms: Names of the hash algorithms (e.g., ['md5', 'sha512', ]), or None
+        for every algorithm that hashlib guarantees.
+    :param int block_size: Number of bytes to read at a time.
+    :return: A dictionary of hashes for the file, by algorithm (False if the algorithm is not
+        available).
     :rtype: dict
     :raises ValueError: if the filepath mask is invalid.
     """
     if not isinstance(filepaths, list):
         filepaths = [filepaths, ]
+    if algorithms is None:
+        # Python 2.7 also has hashlib.algorithms; Python 3 does not. SHAKE digests have no
+        # fixed length, so hexdigest() needs one
+        algorithms = [a for a in sorted(hashlib.algorithms_guaranteed)
+                      if not a.startswith('shake_')]
     file_hashes = {}
     for f in filepaths:
         # noinspection PyTypeChecker
         if not os.path.exists(f):
             raise ValueError("Invalid filepath.")
-        for a in hashlib.algorithms:
+        hashes = {}
+        for a in algorithms:
             try:
-                h = hashlib.new(a)
-                # noinspection PyTypeChecker
-                h.update(open(f, "rb").read())
-                file_hashes.update({a: h.hexdigest()})
+                hashes[a] = hashlib.new(a)
             except ValueError:
                 file_hashes.update({a: False})
+        # noinspection PyTypeChecker
+        with open(f, "rb") as stream:
+            for block in iter(lambda: stream.read(block_size), b''):
+                for h in hashes.values():
+                    h.update(block)
+        file_hashes.update(dict((a, h.hexdigest()) for a, h in hashes.items()))
     return file_hashes